@@ -0,0 +1,46 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import RECIPES, get_version
+
+
+def normalize_query(request, **kwargs):
+    """Приводит параметры запроса к виду, не зависящему от их порядка."""
+    params = sorted(
+        (key, ','.join(sorted(set(request.query_params.getlist(key)))))
+        for key in request.query_params
+    )
+    params.extend(sorted(kwargs.items()))
+    return '&'.join(f'{key}={value}' for key, value in params)
+
+
+def recipes_cache_key(request, view_name, **kwargs):
+    """
+    Ключ кэша по нормализованным параметрам запроса.
+
+    Параметры хэшируются: в поисковом запросе могут быть пробелы и
+    произвольная длина, недопустимые в ключах memcached.
+    """
+    query = hashlib.md5(
+        normalize_query(request, **kwargs).encode()
+    ).hexdigest()
+    return (
+        f'{RECIPES}:{get_version(RECIPES)}:{view_name}:'
+        f'{request.get_host()}:{query}'
+    )
+
+
+def catalog_etag(name, request, **kwargs):
+    """Строгий ETag справочника с учетом параметров запроса."""
+    source = f'{name}:{get_version(name)}:{normalize_query(request, **kwargs)}'
+    return '"{}"'.format(hashlib.md5(source.encode()).hexdigest())
+
+
+def get_cached_response(key):
+    return cache.get(key)
+
+
+def set_cached_response(key, data, timeout=None):
+    cache.set(key, data, timeout or settings.RECIPES_CACHE_TIMEOUT)
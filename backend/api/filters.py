@@ -1,6 +1,7 @@
 from django_filters import rest_framework as filters
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 
 
 class IngredientFilter(filters.FilterSet):
@@ -33,6 +34,13 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(
+        method='get_search'
+    )
+    ordering = filters.ChoiceFilter(
+        choices=(('trending', 'Популярные'),),
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
@@ -40,7 +48,9 @@ class RecipeFilter(filters.FilterSet):
             'tags',
             'author',
             'is_favorited',
-            'is_in_shopping_cart'
+            'is_in_shopping_cart',
+            'search',
+            'ordering',
         )
 
     def get_is_favorited(self, queryset, name, is_filtered):
@@ -52,3 +62,10 @@ class RecipeFilter(filters.FilterSet):
         if is_filtered:
             return queryset.filter(shoppingcart__user=self.request.user)
         return queryset
+
+    def get_search(self, queryset, name, text):
+        return search_recipes(queryset, text)
+
+    def get_ordering(self, queryset, name, value):
+        # Единственный вариант - trending, по индексу очков популярности.
+        return queryset.order_by('-trending_score', '-id')
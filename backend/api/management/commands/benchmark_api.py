@@ -0,0 +1,361 @@
+import io
+import json
+import statistics
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import FoodUser
+
+# 1x1 PNG для запросов на создание рецепта.
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywa'
+    'AAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQI'
+    'mWNoAAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+# Сценарии: (имя, клиент, метод, url, тело, бюджет запросов, статус
+# [, заголовки]). url, тело и заголовки могут быть функциями от состояния
+# прогона; ETag и ссылка на следующую страницу последнего ответа
+# сценария хранятся в state['etag:имя'] и state['next:имя'].
+SCENARIOS = (
+    ('users-list', 'anon', 'get', '/api/users/', None, 3, 200),
+    # is_subscribed считается отдельным запросом для каждого пользователя.
+    ('users-list', 'auth', 'get', '/api/users/', None, 9, 200),
+    ('users-detail', 'auth', 'get',
+     lambda s: f'/api/users/{s["author"]}/', None, 3, 200),
+    ('users-me', 'auth', 'get', '/api/users/me/', None, 1, 200),
+    ('users-subscriptions', 'auth', 'get',
+     '/api/users/subscriptions/?recipes_limit=3', None, 4, 200),
+    ('users-subscriptions-cursor', 'auth', 'get',
+     '/api/users/subscriptions/?pagination=cursor', None, 3, 200),
+    ('tags-list', 'anon', 'get', '/api/tags/', None, 1, 200),
+    ('tags-list-not-modified', 'anon', 'get', '/api/tags/', None, 0, 304,
+     lambda s: {'HTTP_IF_NONE_MATCH': s['etag:tags-list']}),
+    ('tags-detail', 'anon', 'get',
+     lambda s: f'/api/tags/{s["tag"]}/', None, 1, 200),
+    ('ingredients-list', 'anon', 'get', '/api/ingredients/', None, 1, 200),
+    ('ingredients-search', 'anon', 'get',
+     '/api/ingredients/?name=ингр', None, 1, 200),
+    ('ingredients-search-not-modified', 'anon', 'get',
+     '/api/ingredients/?name=ингр', None, 0, 304,
+     lambda s: {'HTTP_IF_NONE_MATCH': s['etag:ingredients-search']}),
+    ('ingredients-detail', 'anon', 'get',
+     lambda s: f'/api/ingredients/{s["ingredient"]}/', None, 1, 200),
+    ('recipes-list', 'anon', 'get', '/api/recipes/', None, 4, 200),
+    ('recipes-list-cached', 'anon', 'get', '/api/recipes/', None, 0, 200),
+    ('recipes-list', 'auth', 'get', '/api/recipes/', None, 5, 200),
+    ('recipes-list-limit', 'auth', 'get',
+     '/api/recipes/?limit=50', None, 5, 200),
+    ('recipes-list-deep-page', 'anon', 'get',
+     '/api/recipes/?page=5', None, 4, 200),
+    ('recipes-list-cursor', 'auth', 'get',
+     '/api/recipes/?pagination=cursor', None, 4, 200),
+    ('recipes-list-cursor-next', 'auth', 'get',
+     lambda s: s['next:recipes-list-cursor'], None, 4, 200),
+    ('recipes-list-tags', 'anon', 'get',
+     lambda s: f'/api/recipes/?tags={s["tag_slug"]}', None, 5, 200),
+    ('recipes-list-author', 'auth', 'get',
+     lambda s: f'/api/recipes/?author={s["author"]}', None, 5, 200),
+    ('recipes-list-favorited', 'auth', 'get',
+     '/api/recipes/?is_favorited=1', None, 5, 200),
+    ('recipes-list-cart', 'auth', 'get',
+     '/api/recipes/?is_in_shopping_cart=1', None, 5, 200),
+    ('recipes-list-trending', 'anon', 'get',
+     '/api/recipes/?ordering=trending', None, 4, 200),
+    ('recipes-list-trending-auth', 'auth', 'get',
+     '/api/recipes/?ordering=trending', None, 5, 200),
+    ('recipes-feed', 'auth', 'get', '/api/recipes/feed/', None, 4, 200),
+    ('recipes-feed-short', 'auth', 'get',
+     '/api/recipes/feed/?short=1', None, 2, 200),
+    ('recipes-cook', 'anon', 'get',
+     lambda s: '/api/recipes/cook/?ingredients={}'.format(
+         ','.join(map(str, s['ingredients'][:10]))
+     ), None, 3, 200),
+    ('recipes-similar', 'anon', 'get',
+     lambda s: f'/api/recipes/{s["recipe"]}/similar/', None, 2, 200),
+    ('recipes-search', 'auth', 'get',
+     lambda s: f'/api/recipes/?search=рецепт&tags={s["tag_slug"]}',
+     None, 6, 200),
+    ('recipes-detail', 'anon', 'get',
+     lambda s: f'/api/recipes/{s["recipe"]}/', None, 3, 200),
+    ('recipes-detail-cached', 'anon', 'get',
+     lambda s: f'/api/recipes/{s["recipe"]}/', None, 0, 200),
+    ('recipes-detail', 'auth', 'get',
+     lambda s: f'/api/recipes/{s["recipe"]}/', None, 4, 200),
+    ('recipes-shopping-list', 'auth', 'get',
+     '/api/recipes/shopping_list/', None, 2, 200),
+    ('recipes-download-cart', 'auth', 'get',
+     '/api/recipes/download_shopping_cart/', None, 2, 200),
+    ('recipes-download-cart-csv', 'auth', 'get',
+     '/api/recipes/download_shopping_cart/?format=csv', None, 2, 200),
+    ('recipes-download-cart-pdf', 'auth', 'get',
+     '/api/recipes/download_shopping_cart/?format=pdf', None, 2, 200),
+    ('recipes-create', 'auth', 'post', '/api/recipes/',
+     lambda s: {
+         'ingredients': [
+             {'id': pk, 'amount': 10} for pk in s['ingredients'][:5]
+         ],
+         'tags': [s['tag']],
+         'image': IMAGE,
+         'name': 'Рецепт для замера',
+         'text': 'Описание',
+         'cooking_time': 10,
+     }, 15, 201),
+    ('recipes-update', 'auth', 'patch',
+     lambda s: f'/api/recipes/{s["created"]}/',
+     lambda s: {
+         'ingredients': [
+             {'id': pk, 'amount': 20} for pk in s['ingredients'][3:8]
+         ],
+         'tags': [s['tag']],
+         'name': 'Рецепт для замера',
+     }, 20, 200),
+    ('recipes-update-name', 'auth', 'patch',
+     lambda s: f'/api/recipes/{s["created"]}/',
+     {'name': 'Новое название'}, 9, 200),
+    ('recipes-delete', 'auth', 'delete',
+     lambda s: f'/api/recipes/{s["created"]}/', None, 15, 204),
+    ('recipes-favorite-add', 'auth', 'post',
+     lambda s: f'/api/recipes/{s["free_recipe"]}/favorite/', None, 5, 201),
+    ('recipes-favorite-add-again', 'auth', 'post',
+     lambda s: f'/api/recipes/{s["free_recipe"]}/favorite/', None, 4, 400),
+    ('recipes-favorite-remove', 'auth', 'delete',
+     lambda s: f'/api/recipes/{s["free_recipe"]}/favorite/', None, 4, 204),
+    ('recipes-cart-add', 'auth', 'post',
+     lambda s: f'/api/recipes/{s["free_recipe"]}/shopping_cart/',
+     None, 8, 201),
+    ('recipes-cart-remove', 'auth', 'delete',
+     lambda s: f'/api/recipes/{s["free_recipe"]}/shopping_cart/',
+     None, 7, 204),
+    ('recipes-favorite-bulk-add', 'auth', 'post', '/api/recipes/favorite/',
+     lambda s: {'recipes': s['bulk_recipes']}, 5, 200),
+    ('recipes-favorite-bulk-remove', 'auth', 'delete',
+     '/api/recipes/favorite/',
+     lambda s: {'recipes': s['bulk_recipes']}, 5, 200),
+    ('recipes-cart-bulk-add', 'auth', 'post', '/api/recipes/shopping_cart/',
+     lambda s: {'recipes': s['bulk_recipes']}, 9, 200),
+    ('recipes-cart-bulk-remove', 'auth', 'delete',
+     '/api/recipes/shopping_cart/',
+     lambda s: {'recipes': s['bulk_recipes']}, 9, 200),
+    ('users-subscribe', 'auth', 'post',
+     lambda s: f'/api/users/{s["free_author"]}/subscribe/', None, 5, 201),
+    ('users-subscribe-again', 'auth', 'post',
+     lambda s: f'/api/users/{s["free_author"]}/subscribe/', None, 4, 400),
+    ('users-unsubscribe', 'auth', 'delete',
+     lambda s: f'/api/users/{s["free_author"]}/subscribe/', None, 4, 204),
+)
+
+
+class Command(BaseCommand):
+    """
+    Замеряет количество запросов к БД и время ответа эндпоинтов API.
+
+    Команда создает тестовую базу данных, заполняет ее командой
+    seed_fake_data, вызывает все маршруты api/urls.py от анонима
+    и от пользователя и завершается ошибкой, если превышен бюджет
+    запросов.
+
+    Использование:
+    python manage.py benchmark_api --repeat 5 --output report.json
+    """
+
+    help = 'Замеряет запросы к БД и время ответа эндпоинтов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=300)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--output', help='Путь для JSON-отчета.')
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    })
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(MEDIA_ROOT=media_root):
+                    call_command(
+                        'seed_fake_data',
+                        users=options['users'],
+                        recipes=options['recipes'],
+                        ingredients=options['ingredients'],
+                        favorites=options['users'] * 10,
+                        carts=options['users'] * 5,
+                        follows=options['users'] * 5,
+                        seed=options['seed'],
+                        stdout=io.StringIO(),
+                    )
+                    report = self.run_scenarios(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        self.print_report(report)
+        failed = [row for row in report if row['errors']]
+        if failed:
+            raise CommandError(
+                'Превышен бюджет или неверный ответ: {}'.format(
+                    ', '.join(
+                        f'{row["name"]} ({row["client"]})' for row in failed
+                    )
+                )
+            )
+
+    def prepare_state(self):
+        """Готовит пользователя, клиентов и объекты для сценариев."""
+        user = (
+            FoodUser.objects.filter(subscriber__isnull=False)
+            .order_by('id').first()
+        )
+        followed = user.subscriber.values_list('following_id', flat=True)
+        free_author = (
+            FoodUser.objects.exclude(id__in=followed)
+            .exclude(id=user.id).order_by('id').first()
+        )
+        free_recipe = (
+            Recipe.objects.exclude(favorite__user=user)
+            .exclude(shoppingcart__user=user).order_by('id').first()
+        )
+        tag = Tag.objects.order_by('id').first()
+        auth = APIClient()
+        auth.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}'
+        )
+        clients = {'anon': APIClient(), 'auth': auth}
+        state = {
+            'author': Recipe.objects.order_by('id').first().author_id,
+            'recipe': Recipe.objects.order_by('id').first().id,
+            'free_recipe': free_recipe.id,
+            'bulk_recipes': list(
+                Recipe.objects.order_by('-id')
+                .values_list('id', flat=True)[:50]
+            ),
+            'free_author': free_author.id,
+            'tag': tag.id,
+            'tag_slug': tag.slug,
+            'ingredient': Ingredient.objects.order_by('id').first().id,
+            'ingredients': list(
+                Ingredient.objects.order_by('id')
+                .values_list('id', flat=True)[:10]
+            ),
+        }
+        return clients, state
+
+    def run_scenarios(self, repeat):
+        """Прогоняет сценарии и собирает метрики."""
+        clients, state = self.prepare_state()
+        measurements = {}
+        for _ in range(repeat):
+            cache.clear()
+            for scenario in SCENARIOS:
+                name, client, method, url, data, _, _, *headers = scenario
+                url = url(state) if callable(url) else url
+                data = data(state) if callable(data) else data
+                headers = headers[0](state) if headers else {}
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = getattr(clients[client], method)(
+                        url, data, format='json', **headers
+                    )
+                    size = len(self.read_content(response))
+                    wall = time.perf_counter() - started
+                if name == 'recipes-create' and response.status_code == 201:
+                    state['created'] = response.json()['id']
+                if method == 'get' and response.status_code == 200:
+                    data = getattr(response, 'data', None)
+                    if isinstance(data, dict) and data.get('next'):
+                        state[f'next:{name}'] = data['next']
+                if response.has_header('ETag'):
+                    state[f'etag:{name}'] = response['ETag']
+                measurements.setdefault((name, client), []).append({
+                    'url': url,
+                    'status': response.status_code,
+                    'queries': len(context.captured_queries),
+                    'db_time': sum(
+                        float(query['time'])
+                        for query in context.captured_queries
+                    ),
+                    'wall_time': wall,
+                    'bytes': size,
+                })
+
+        budgets = {
+            (name, client): (budget, expected)
+            for name, client, _, _, _, budget, expected, *_ in SCENARIOS
+        }
+        report = []
+        for (name, client), runs in measurements.items():
+            budget, expected = budgets[(name, client)]
+            queries = max(run['queries'] for run in runs)
+            errors = []
+            if queries > budget:
+                errors.append(f'запросов {queries} > {budget}')
+            statuses = {run['status'] for run in runs}
+            if statuses != {expected}:
+                errors.append(f'статус {sorted(statuses)} != {expected}')
+            report.append({
+                'name': name,
+                'client': client,
+                'url': runs[0]['url'],
+                'queries': queries,
+                'budget': budget,
+                'db_time_ms': round(
+                    statistics.median(run['db_time'] for run in runs) * 1000,
+                    3,
+                ),
+                'wall_time_ms': round(
+                    statistics.median(
+                        run['wall_time'] for run in runs) * 1000,
+                    3,
+                ),
+                'bytes': max(run['bytes'] for run in runs),
+                'errors': errors,
+            })
+        return report
+
+    @staticmethod
+    def read_content(response):
+        """Возвращает тело ответа, в том числе потокового."""
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def print_report(self, report):
+        for row in report:
+            line = (
+                f'{row["name"]:<32} {row["client"]:<5} '
+                f'{row["queries"]:>4}/{row["budget"]:<4} '
+                f'{row["db_time_ms"]:>9.2f} ms db '
+                f'{row["wall_time_ms"]:>9.2f} ms '
+                f'{row["bytes"]:>9} B'
+            )
+            if row['errors']:
+                self.stdout.write(self.style.ERROR(
+                    f'{line}  {"; ".join(row["errors"])}'
+                ))
+            else:
+                self.stdout.write(line)
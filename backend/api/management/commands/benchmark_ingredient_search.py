@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.core.management import BaseCommand
+
+from api.filters import IngredientFilter
+from api.search import ingredient_index
+from api.serializers import IngredientSerializer
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает поиск ингредиентов через IngredientFilter и индекс в памяти.
+
+    Запросы — случайные начала названий длиной от 1 до 4 символов,
+    как при наборе в редакторе рецепта. Учитывается и сериализация.
+
+    Использование:
+    python manage.py benchmark_ingredient_search --queries 500
+    """
+
+    help = 'Сравнивает поиск ингредиентов в БД и в индексе в памяти.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            self.stdout.write(
+                self.style.ERROR('Справочник ингредиентов пуст.')
+            )
+            return
+        queries = [
+            name[:rnd.randint(1, 4)]
+            for name in rnd.choices(names, k=options['queries'])
+        ]
+
+        started = time.perf_counter()
+        for query in queries:
+            queryset = IngredientFilter(
+                {'name': query},
+                queryset=Ingredient.objects.all(),
+            ).qs
+            IngredientSerializer(queryset, many=True).data
+        database = time.perf_counter() - started
+
+        ingredient_index.ensure_actual()
+        started = time.perf_counter()
+        for query in queries:
+            ingredient_index.search(query)
+        index = time.perf_counter() - started
+
+        for title, elapsed in (('IngredientFilter', database),
+                               ('IngredientIndex', index)):
+            self.stdout.write(
+                f'{title:<17} {elapsed * 1000 / len(queries):>9.3f} ms/запрос'
+            )
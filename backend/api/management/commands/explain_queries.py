@@ -0,0 +1,150 @@
+import re
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import RecipeViewSet, UserViewSet
+from recipes.models import Favorite, RecipeIngredient, Tag
+from users.models import FoodUser
+
+SEQ_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\bUSING\b)'),
+}
+
+
+class Command(BaseCommand):
+    """
+    Выполняет EXPLAIN для запросов эндпоинтов API.
+
+    Наборы запросов строятся теми же вьюсетами, что обрабатывают
+    запросы, и команда завершается ошибкой, если в плане есть
+    последовательное чтение таблицы больше --min-rows строк.
+
+    Использование:
+    python manage.py explain_queries --analyze --min-rows 10000
+    """
+
+    help = 'Проверяет планы запросов эндпоинтов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=10000)
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Обновить статистику планировщика перед проверкой.'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQ_SCAN:
+            raise CommandError(
+                f'СУБД {connection.vendor} не поддерживается.'
+            )
+        user = (
+            FoodUser.objects.filter(subscriber__isnull=False)
+            .order_by('id').first()
+        )
+        if user is None:
+            raise CommandError('В базе нет пользователей с подписками.')
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        sizes = {}
+        failed = []
+        for name, queryset in self.get_querysets(user):
+            plan = queryset.explain()
+            scanned = {
+                table for table in SEQ_SCAN[connection.vendor].findall(plan)
+                if self.table_size(table, sizes) >= options['min_rows']
+            }
+            if scanned:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: последовательное чтение {", ".join(scanned)}'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+            if options['verbosity'] > 1 or scanned:
+                self.stdout.write(plan)
+        if failed:
+            raise CommandError(
+                'Последовательное чтение больших таблиц: {}'.format(
+                    ', '.join(failed)
+                )
+            )
+
+    @staticmethod
+    def table_size(table, sizes):
+        if table not in sizes:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+                )
+                sizes[table] = cursor.fetchone()[0]
+        return sizes[table]
+
+    def get_querysets(self, user):
+        """
+        Возвращает пары (имя, queryset) для проверки.
+
+        Поиск ингредиентов не обращается к базе: на него отвечает индекс в
+        памяти процесса, который измеряет benchmark_ingredient_search.
+        """
+        recipes = self.view_queryset(RecipeViewSet, user, 'list')
+        recipe_ids = list(recipes.values_list('id', flat=True)[:6])
+        recipe = recipe_ids[0] if recipe_ids else 0
+        tag = Tag.objects.order_by('id').first()
+        querysets = (
+            ('recipes-list', recipes[:6]),
+            ('recipes-list-anonymous',
+             self.view_queryset(RecipeViewSet, None, 'list')[:6]),
+            ('recipes-list-deep-page', recipes[600:606]),
+            ('recipes-list-tags', self.view_queryset(
+                RecipeViewSet, user, 'list',
+                {'tags': tag.slug if tag else ''})[:6]),
+            ('recipes-list-author', self.view_queryset(
+                RecipeViewSet, user, 'list', {'author': user.id})[:6]),
+            ('recipes-list-favorited', self.view_queryset(
+                RecipeViewSet, user, 'list', {'is_favorited': 1})[:6]),
+            ('recipes-list-cart', self.view_queryset(
+                RecipeViewSet, user, 'list', {'is_in_shopping_cart': 1})[:6]),
+            ('recipes-list-trending', self.view_queryset(
+                RecipeViewSet, user, 'list', {'ordering': 'trending'})[:6]),
+            ('recipes-ingredients-prefetch',
+             RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+             .select_related('ingredient')),
+            ('recipes-tags-prefetch',
+             Tag.objects.filter(recipes__in=recipe_ids)),
+            ('recipes-favorite-count',
+             Favorite.objects.filter(recipe_id=recipe)),
+            ('recipes-feed', self.view_queryset(
+                RecipeViewSet, user, 'feed'
+            ).feed(user).order_by('-pub_date', '-id')[:6]),
+            ('users-list', self.view_queryset(UserViewSet, None, 'list')[:6]),
+            ('users-subscriptions', user.subscriber.all()[:6]),
+            ('users-author-recipes', user.recipes.all()[:3]),
+        )
+        if connection.vendor == 'postgresql':
+            # На других СУБД поиск идет по подстроке без индекса.
+            querysets += (
+                ('recipes-search', self.view_queryset(
+                    RecipeViewSet, user, 'list', {'search': 'салат'})[:6]),
+            )
+        return querysets
+
+    @staticmethod
+    def view_queryset(viewset, user, action, params=None):
+        """Строит отфильтрованный queryset так же, как это делает вьюсет."""
+        request = APIRequestFactory().get('/', params or {})
+        if user is not None:
+            force_authenticate(request, user)
+        view = viewset()
+        view.action = action
+        view.action_map = {'get': action}
+        view.args = ()
+        view.kwargs = {}
+        view.format_kwarg = None
+        view.request = view.initialize_request(request)
+        view.headers = {}
+        return view.filter_queryset(view.get_queryset())
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.cache import catalog_etag
+from core.paginators import is_cursor_requested
+
+
+class ConditionalCatalogMixin:
+    """Отдает справочник с ETag и отвечает 304 на If-None-Match."""
+
+    catalog_name = None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            catalog_etag(self.catalog_name, request),
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            catalog_etag(self.catalog_name, request, pk=kwargs['pk']),
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def conditional_response(self, etag, handler, request, *args, **kwargs):
+        """Возвращает 304, если у клиента актуальная версия справочника."""
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE
+        )
+        return response
+
+
+class CursorPaginationMixin:
+    """Включает пагинацию по курсору по запросу клиента."""
+
+    cursor_pagination_class = None
+
+    def get_cursor_pagination_class(self):
+        return self.cursor_pagination_class
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.get_cursor_pagination_class()
+            if pagination_class is None or not is_cursor_requested(
+                    self.request):
+                pagination_class = self.pagination_class
+            self._paginator = (
+                pagination_class() if pagination_class is not None else None
+            )
+        return self._paginator
@@ -0,0 +1,20 @@
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Парсер NDJSON.
+
+    Возвращает генератор строк тела запроса, чтобы большой файл
+    не читался в память целиком.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return []
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        return (
+            line.decode(encoding) for line in iter(stream.readline, b'')
+        )
@@ -0,0 +1,256 @@
+import itertools
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import COVERAGE, INGREDIENTS, get_version
+from recipes.models import Ingredient, RecipeIngredient
+
+# Сколько изменений рецептов процесс применяет к индексу покрытия,
+# не перестраивая его целиком.
+COVERAGE_MAX_CHANGES = 1000
+
+EMPTY = np.zeros(0, dtype=np.int32)
+
+
+class IngredientIndex:
+    """
+    Отсортированный индекс названий ингредиентов в памяти процесса.
+
+    Строится при первом запросе и перестраивается, когда меняется версия
+    справочника ингредиентов. Поиск по началу названия выполняется
+    двоичным поиском, совпадения по подстроке идут после них.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.keys = []
+        self.rows = []
+
+    def build(self):
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].casefold(), row['id']),
+        )
+        self.keys = [row['name'].casefold() for row in rows]
+        self.rows = rows
+
+    def ensure_actual(self):
+        version = get_version(INGREDIENTS)
+        if self.version == version:
+            return
+        with self.lock:
+            if self.version != version:
+                self.build()
+                self.version = version
+
+    def search(self, query, limit=None):
+        """Возвращает ингредиенты, название которых начинается с query."""
+        self.ensure_actual()
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        keys, rows = self.keys, self.rows
+        prefix = query.casefold()
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and end - start < limit:
+            if not keys[end].startswith(prefix):
+                break
+            end += 1
+        result = rows[start:end]
+        if len(result) < limit:
+            result.extend(
+                row for key, row in zip(keys, rows)
+                if prefix in key and not key.startswith(prefix)
+            )
+        return result[:limit]
+
+
+ingredient_index = IngredientIndex()
+
+
+class RecipeCoverageIndex:
+    """
+    Обратный индекс ингредиент -> рецепты в памяти процесса.
+
+    Рецепту соответствует позиция в массивах NumPy: id рецепта и число
+    его ингредиентов. Для каждого ингредиента хранится массив позиций
+    рецептов с ним, а ингредиенты рецептов - в сжатом построчном виде
+    (indptr и indices), поэтому индекс на миллионы строк RecipeIngredient
+    занимает десятки мегабайт.
+
+    Изменения рецептов публикуются в кэше функцией
+    publish_recipe_changes: версия индекса увеличивается, а id
+    измененных рецептов сохраняются под ключом этой версии. Процесс,
+    отставший не больше чем на COVERAGE_MAX_CHANGES версий, перечитывает
+    только эти рецепты, иначе перестраивает индекс целиком.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.needed = np.zeros(0, dtype=np.int16)
+        self.size = 0
+        self.positions = {}
+        self.postings = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = EMPTY
+        self.changed = {}
+
+    def build(self):
+        pairs = np.fromiter(
+            itertools.chain.from_iterable(
+                RecipeIngredient.objects.order_by()
+                .values_list('recipe_id', 'ingredient_id')
+                .iterator(chunk_size=10000)
+            ),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        recipe_ids, positions = np.unique(pairs[:, 0], return_inverse=True)
+        positions = positions.astype(np.int32)
+        ingredient_ids = pairs[:, 1].astype(np.int32)
+        needed = np.bincount(positions, minlength=len(recipe_ids))
+        by_recipe = np.argsort(positions, kind='stable')
+        by_ingredient = np.argsort(ingredient_ids, kind='stable')
+        sorted_ids = ingredient_ids[by_ingredient]
+        keys, starts = np.unique(sorted_ids, return_index=True)
+        self.recipe_ids = recipe_ids
+        self.needed = needed.astype(np.int16)
+        self.size = len(recipe_ids)
+        self.positions = dict(zip(recipe_ids.tolist(), range(self.size)))
+        self.postings = dict(zip(
+            keys.tolist(), np.split(positions[by_ingredient], starts[1:])
+        ))
+        self.indptr = np.concatenate(([0], np.cumsum(needed)))
+        self.indices = ingredient_ids[by_recipe]
+        self.changed = {}
+
+    def recipe_ingredients(self, position):
+        """Ингредиенты рецепта на позиции position."""
+        if position in self.changed:
+            return self.changed[position]
+        return self.indices[self.indptr[position]:self.indptr[position + 1]]
+
+    def add_position(self, recipe_id):
+        if self.size == len(self.recipe_ids):
+            capacity = max(2 * self.size, 16)
+            self.recipe_ids = np.resize(self.recipe_ids, capacity)
+            self.needed = np.resize(self.needed, capacity)
+            self.needed[self.size:] = 0
+        position = self.size
+        self.recipe_ids[position] = recipe_id
+        self.positions[recipe_id] = position
+        self.size += 1
+        return position
+
+    def refresh(self, recipe_ids):
+        """Перечитывает ингредиенты рецептов recipe_ids одним запросом."""
+        current = defaultdict(list)
+        for recipe_id, ingredient_id in (
+            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+            .values_list('recipe_id', 'ingredient_id')
+        ):
+            current[recipe_id].append(ingredient_id)
+        for recipe_id in recipe_ids:
+            ingredients = np.array(
+                sorted(current.get(recipe_id, ())), dtype=np.int32
+            )
+            position = self.positions.get(recipe_id)
+            if position is None:
+                if not len(ingredients):
+                    continue
+                position = self.add_position(recipe_id)
+                old = EMPTY
+            else:
+                old = self.recipe_ingredients(position)
+            for pk in np.setdiff1d(old, ingredients).tolist():
+                postings = self.postings[pk]
+                self.postings[pk] = postings[postings != position]
+            for pk in np.setdiff1d(ingredients, old).tolist():
+                self.postings[pk] = np.append(
+                    self.postings.get(pk, EMPTY), np.int32(position)
+                )
+            self.needed[position] = len(ingredients)
+            self.changed[position] = ingredients
+
+    def ensure_actual(self):
+        version = get_version(COVERAGE)
+        if self.version == version:
+            return
+        with self.lock:
+            if self.version == version:
+                return
+            changes = None
+            if (
+                self.version is not None
+                and 0 < version - self.version <= COVERAGE_MAX_CHANGES
+            ):
+                keys = [
+                    f'{COVERAGE}:changes:{number}'
+                    for number in range(self.version + 1, version + 1)
+                ]
+                changes = cache.get_many(keys)
+                if len(changes) < len(keys):
+                    changes = None
+            if changes is None:
+                self.build()
+            else:
+                self.refresh(set().union(*changes.values()))
+            self.version = version
+
+    def search(self, ingredient_ids, limit):
+        """
+        Рецепты, больше всего покрытые ингредиентами ingredient_ids.
+
+        Рецепты сортируются по доле имеющихся ингредиентов, затем по
+        числу недостающих и от новых к старым. Возвращает словари
+        с id рецепта, числом совпавших и всех ингредиентов и id
+        недостающих ингредиентов.
+        """
+        self.ensure_actual()
+        with self.lock:
+            counts = np.zeros(self.size, dtype=np.int16)
+            for pk in set(ingredient_ids):
+                positions = self.postings.get(pk)
+                if positions is not None:
+                    counts[positions] += 1
+            candidates = np.flatnonzero(counts)
+            if not len(candidates):
+                return []
+            matched = counts[candidates]
+            needed = self.needed[candidates]
+            coverage = matched / needed
+            if len(candidates) > limit:
+                # Полностью сортируются только рецепты с покрытием
+                # не меньше limit-го по величине.
+                threshold = np.partition(coverage, -limit)[-limit]
+                keep = coverage >= threshold
+                candidates, matched, needed, coverage = (
+                    candidates[keep], matched[keep], needed[keep],
+                    coverage[keep],
+                )
+            order = np.lexsort((
+                -self.recipe_ids[candidates], needed - matched, -coverage
+            ))[:limit]
+            available = np.array(sorted(set(ingredient_ids)), dtype=np.int32)
+            return [
+                {
+                    'id': int(self.recipe_ids[position]),
+                    'matched_count': int(matched[index]),
+                    'ingredients_count': int(needed[index]),
+                    'missing': np.setdiff1d(
+                        self.recipe_ingredients(position), available
+                    ).tolist(),
+                }
+                for index, position in zip(
+                    order.tolist(), candidates[order].tolist()
+                )
+            ]
+
+
+recipe_coverage_index = RecipeCoverageIndex()
@@ -1,18 +1,35 @@
 import base64
+import binascii
+from collections import Counter
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from core.cache import bump_recipes_version, publish_recipe_changes
+from core.consts import (
+    MAX_BULK_RECIPES,
+    MAX_PAGE_SIZE,
+    MAX_PANTRY_INGREDIENTS,
+    MAX_RECIPES_LIMIT,
+    PAGE_SIZE,
+)
+from recipes.images import base64_dimensions, base64_size
 from recipes.models import (
     Favorite,
     Ingredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
     Recipe,
     RecipeIngredient,
 )
+from recipes.search import schedule_search_update
+from recipes.totals import amounts_diff, change_recipe_totals
 from users.models import Follow
 
 FoodUser = get_user_model()
@@ -45,6 +62,8 @@ class FoodUserSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(following, 'is_subscribed'):
+            return following.is_subscribed
         return following.following.filter(user=user).exists()
 
 
@@ -66,6 +85,49 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id рецептов для массовых операций."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES,
+    )
+
+    def validate_recipes(self, value):
+        """Убирает повторы, сохраняя порядок."""
+        return list(dict.fromkeys(value))
+
+
+class PantrySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_PANTRY_INGREDIENTS,
+    )
+    limit = serializers.IntegerField(
+        min_value=1, max_value=MAX_PAGE_SIZE, default=PAGE_SIZE
+    )
+
+
+def get_recipes_limit(request):
+    """Проверяет параметр recipes_limit и ограничивает его сверху."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return MAX_RECIPES_LIMIT
+    try:
+        recipes_limit = int(recipes_limit)
+    except ValueError:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Должно быть целым числом.'})
+    if recipes_limit < 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Не может быть отрицательным.'})
+    return min(recipes_limit, MAX_RECIPES_LIMIT)
+
+
 class FollowSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='following.id')
     username = serializers.ReadOnlyField(source='following.username')
@@ -74,7 +136,9 @@ class FollowSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField(source='following.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='recipes.count')
+    recipes_count = serializers.ReadOnlyField(
+        source='following.recipes_count'
+    )
 
     class Meta:
         model = Follow
@@ -97,6 +161,8 @@ class FollowSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
+        if obj.user_id == request.user.id:
+            return True
         return request.user.is_authenticated and Follow.objects.filter(
             user=request.user,
             following=obj.following
@@ -104,14 +170,14 @@ class FollowSerializer(serializers.ModelSerializer):
 
     def get_recipes(self, obj):
         """Возвращает рецепты автора."""
-        recipes = obj.following.recipes.all()
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit')
-
-        if recipes_limit is not None:
-            recipes = recipes[:int(recipes_limit)]
-
-        return RecipeReadSerializer(
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.following_id, ())
+        else:
+            recipes = obj.following.recipes.all()[
+                :get_recipes_limit(self.context['request'])
+            ]
+        return FavoriteRecipeSerializer(
             recipes,
             many=True,
             context={'request': self.context.get('request')}).data
@@ -124,25 +190,6 @@ class FollowSubSerializer(serializers.ModelSerializer):
         model = Follow
         fields = ('user', 'following')
 
-    def validate(self, data):
-        """Проверяет наличие подписки на самого себя и повторную подписку."""
-        request = self.context.get('request')
-        user = request.user
-
-        # Проверка на подписку на самого себя
-        if user == data['following']:
-            raise serializers.ValidationError(
-                'Вы не можете подписаться на себя.')
-
-        # Проверка на повторную подписку
-        existing_subscription = Follow.objects.filter(
-            user=user, following=data['following'])
-        if existing_subscription.exists():
-            raise serializers.ValidationError(
-                'Вы уже подписаны на этого пользователя.')
-
-        return data
-
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор модели ингредиента."""
@@ -160,6 +207,30 @@ class IngredientSerializer(serializers.ModelSerializer):
         )
 
 
+class CoverageRecipeSerializer(FavoriteRecipeSerializer):
+    """Рецепт с числом имеющихся и недостающими ингредиентами."""
+
+    matched_count = serializers.IntegerField(read_only=True)
+    ingredients_count = serializers.IntegerField(read_only=True)
+    missing_ingredients = IngredientSerializer(many=True, read_only=True)
+
+    class Meta(FavoriteRecipeSerializer.Meta):
+        fields = FavoriteRecipeSerializer.Meta.fields + (
+            'matched_count',
+            'ingredients_count',
+            'missing_ingredients',
+        )
+
+
+class SimilarRecipeSerializer(FavoriteRecipeSerializer):
+    """Похожий рецепт со сходством."""
+
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(FavoriteRecipeSerializer.Meta):
+        fields = FavoriteRecipeSerializer.Meta.fields + ('score',)
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор модели тега."""
 
@@ -202,12 +273,39 @@ class Base64ImageField(serializers.ImageField):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
+            self.check_size(imgstr)
             data = ContentFile(
                 base64.b64decode(imgstr), name='temp.{}'.format(ext)
             )
 
         return super().to_internal_value(data)
 
+    @staticmethod
+    def check_size(imgstr):
+        """Проверяет объем и размеры изображения до его декодирования."""
+        if base64_size(imgstr) > settings.MAX_IMAGE_SIZE:
+            raise serializers.ValidationError(
+                'Размер изображения не должен превышать {} МБ.'.format(
+                    settings.MAX_IMAGE_SIZE // (1024 * 1024)
+                )
+            )
+        try:
+            size = base64_dimensions(imgstr)
+        except (binascii.Error, ValueError, OSError, SyntaxError):
+            # Некорректный base64 или заголовок, который Pillow не
+            # смог разобрать.
+            size = None
+        if size is None:
+            raise serializers.ValidationError(
+                'Загрузите правильное изображение.'
+            )
+        if max(size) > settings.MAX_IMAGE_SIDE:
+            raise serializers.ValidationError(
+                'Стороны изображения не должны превышать {} пикселей.'.format(
+                    settings.MAX_IMAGE_SIDE
+                )
+            )
+
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор модели ингредиента рецепта."""
@@ -229,6 +327,25 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         )
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    """Сериализатор итогового количества ингредиента в списке покупок."""
+
+    id = serializers.ReadOnlyField(source='ingredient_id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = (
+            'id',
+            'name',
+            'measurement_unit',
+            'amount'
+        )
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор модели для создания рецепта."""
 
@@ -248,6 +365,28 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('author',)
 
+    def validate_ingredients(self, ingredients):
+        """Проверяет ингредиенты рецепта одним запросом к базе."""
+        counts = Counter(item['id'] for item in ingredients)
+        duplicates = sorted(pk for pk, count in counts.items() if count > 1)
+        if duplicates:
+            raise serializers.ValidationError(
+                'Ингредиенты повторяются: {}.'.format(
+                    ', '.join(map(str, duplicates))
+                )
+            )
+        unknown = counts.keys() - set(
+            Ingredient.objects.filter(id__in=counts)
+            .values_list('id', flat=True)
+        )
+        if unknown:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: {}.'.format(
+                    ', '.join(map(str, sorted(unknown)))
+                )
+            )
+        return ingredients
+
     @staticmethod
     def create_ingredients(ingredients, recipe):
         """Создает список ингредиентов."""
@@ -263,6 +402,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             recipe_ingredients.append(recipe_ingredient)
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         """Создает новый рецепт."""
         ingredients = validated_data.pop('ingredients')
@@ -275,19 +415,107 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновляет рецепт."""
-        ingredients_data = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
-        instance.tags.set(tags_data)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_ingredients(ingredients_data, instance)
-        return super().update(instance, validated_data)
+        """
+        Обновляет рецепт, меняя только изменившиеся ингредиенты и теги.
+
+        Итоги списков покупок с этим рецептом получают разницу
+        в количествах ингредиентов. Ингредиенты пишутся пакетными
+        запросами без сигналов, и рецепт может не сохраняться вовсе,
+        поэтому кэш рецептов сбрасывается здесь после коммита.
+        """
+        ingredients_data = validated_data.pop('ingredients', None)
+        tags_data = validated_data.pop('tags', None)
+        changed = False
+        if tags_data is not None:
+            changed |= self.update_tags(instance, tags_data)
+        if ingredients_data is not None:
+            changed |= self.update_ingredients(instance, ingredients_data)
+        if changed:
+            transaction.on_commit(bump_recipes_version)
+        # Сохраняются только переданные поля: счетчики и очки
+        # популярности меняются отдельными UPDATE и не должны
+        # перезаписываться значениями, прочитанными в начале запроса.
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
+        return instance
+
+    @staticmethod
+    def update_tags(recipe, tags):
+        """
+        Добавляет новые и удаляет снятые теги рецепта.
+
+        Возвращает True, если теги изменились.
+        """
+        current = set(recipe.tags.values_list('id', flat=True))
+        submitted = {tag.id for tag in tags}
+        if submitted - current:
+            recipe.tags.add(*(submitted - current))
+        if current - submitted:
+            recipe.tags.remove(*(current - submitted))
+        return submitted != current
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """
+        Вставляет, изменяет и удаляет только отличающиеся ингредиенты.
+
+        Строки пишутся пакетными запросами, которые не отправляют
+        сигналы, поэтому метод сам делает то, что зависит от
+        ингредиентов рецепта: применяет разницу к итогам списков
+        покупок, а после коммита обновляет индекс покрытия и поисковый
+        вектор. Кэш рецептов сбрасывает вызывающий код, если метод
+        вернул True, то есть ингредиенты изменились.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {pk: item.amount for pk, item in current.items()}
+        submitted = {
+            item['id']: abs(item['amount']) for item in ingredients
+        }
+        removed = current.keys() - submitted.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in submitted.items()
+            if ingredient_id not in current
+        )
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = submitted.get(ingredient_id, item.amount)
+            if amount != item.amount:
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        diff = amounts_diff(old_amounts, submitted)
+        change_recipe_totals(recipe.pk, diff)
+        if not removed and not diff:
+            return False
+        recipe_id = recipe.pk
+        transaction.on_commit(lambda: publish_recipe_changes((recipe_id,)))
+        schedule_search_update(Recipe.objects.filter(pk=recipe_id))
+        return True
 
     def to_representation(self, instance):
         """Меняет экземпляр в его представление."""
         request = self.context.get('request')
         context = {'request': request}
+        instance = (
+            Recipe.objects.with_related()
+            .with_user_flags(request.user)
+            .get(pk=instance.pk)
+        )
         serializer = RecipeReadSerializer(instance, context=context)
         return serializer.data
 
@@ -299,6 +527,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = FoodUserSerializer(read_only=True)
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -313,6 +542,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
@@ -324,10 +554,33 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
 
+    def to_representation(self, instance):
+        """Передает автору аннотированный флаг подписки."""
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
+    def get_image_variants(self, recipe):
+        """Ссылки на уменьшенные копии, если они уже созданы."""
+        variants = recipe.image_variants
+        if not recipe.image or variants.get('source') != recipe.image.name:
+            return {}
+        request = self.context.get('request')
+        urls = {}
+        for variant, path in variants.items():
+            if variant == 'source':
+                continue
+            url = default_storage.url(path)
+            urls[variant] = (
+                request.build_absolute_uri(url) if request else url
+            )
+        return urls
+
     def get_ingredients(self, recipe):
         """Получает ингредиенты для рецепта."""
         recipe_ingredients = recipe.recipeingredient_set.all()
@@ -338,6 +591,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return Favorite.objects.filter(
             user=user, recipe=obj
         ).exists()
@@ -347,6 +602,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return ShoppingCart.objects.filter(
             user=user, recipe=obj
         ).exists()
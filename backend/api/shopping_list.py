@@ -0,0 +1,126 @@
+import csv
+import fcntl
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+TITLE = 'Список ингредиентов для покупок:'
+
+
+class ExportBusy(Exception):
+    """Все слоты формирования PDF заняты."""
+
+
+@contextmanager
+def pdf_slot():
+    """
+    Занимает один из PDF_EXPORT_WORKERS слотов, общих для всех процессов.
+
+    Слот - блокировка flock на файле в LOCK_DIR, поэтому
+    ограничение действует на все воркеры gunicorn на хосте, а слот
+    освобождается, даже если процесс упал. Если свободного слота нет,
+    сразу вызывается ExportBusy: запрос не ждет и не занимает воркер.
+    """
+    for number in range(settings.PDF_EXPORT_WORKERS):
+        file = open(os.path.join(
+            settings.LOCK_DIR, f'foodgram-pdf-{number}.lock'
+        ), 'a')
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            continue
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+            file.close()
+        return
+    raise ExportBusy
+
+
+def get_ingredient_totals(user):
+    """Итоги ингредиентов из списка покупок, по алфавиту."""
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
+        .values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        )
+        .iterator(chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+    )
+
+
+def iter_text(rows):
+    yield f'{TITLE}\n'
+    for name, measurement_unit, amount in rows:
+        yield f'{name} ({measurement_unit}) - {amount}\n'
+
+
+class Echo:
+    """Объект с методом write, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def get_pdf_font():
+    font_path = settings.PDF_FONT_PATH
+    if not os.path.exists(font_path):
+        return 'Helvetica'
+    if 'ShoppingListFont' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont('ShoppingListFont', font_path))
+    return 'ShoppingListFont'
+
+
+def write_pdf(rows, file):
+    """Записывает список покупок в file постранично."""
+    font = get_pdf_font()
+    pdf = canvas.Canvas(file, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+    y = height - margin
+    pdf.setFont(font, 16)
+    pdf.drawString(margin, y, TITLE)
+    pdf.setFont(font, 12)
+    y -= line_height * 2
+    for name, measurement_unit, amount in rows:
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont(font, 12)
+            y = height - margin
+        pdf.drawString(margin, y, f'• {name} ({measurement_unit}) - {amount}')
+        y -= line_height
+    pdf.save()
+
+
+def render_pdf(user):
+    """
+    Формирует PDF, если есть свободный слот.
+
+    Результат пишется во временный файл, который в памяти держится
+    только до PDF_EXPORT_SPOOL_SIZE байт.
+    """
+    with pdf_slot():
+        file = tempfile.SpooledTemporaryFile(
+            max_size=settings.PDF_EXPORT_SPOOL_SIZE
+        )
+        write_pdf(get_ingredient_totals(user), file)
+    file.seek(0)
+    return file
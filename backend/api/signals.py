@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.cache import (
+    INGREDIENTS,
+    TAGS,
+    bump_recipes_version,
+    bump_version,
+    publish_recipe_changes,
+)
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+FoodUser = get_user_model()
+
+AUTHOR_FIELDS = {'id', 'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=FoodUser)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes_cache(sender, **kwargs):
+    """Сбрасывает кэш рецептов после фиксации транзакции."""
+    transaction.on_commit(bump_recipes_version)
+
+
+@receiver(post_save, sender=FoodUser)
+def invalidate_recipes_cache_on_author_change(sender, update_fields,
+                                              **kwargs):
+    """Сбрасывает кэш рецептов, если изменились поля автора."""
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        return
+    transaction.on_commit(bump_recipes_version)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags_etag(sender, **kwargs):
+    """Меняет версию справочника тегов."""
+    transaction.on_commit(lambda: bump_version(TAGS))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients_etag(sender, **kwargs):
+    """Меняет версию справочника ингредиентов."""
+    transaction.on_commit(lambda: bump_version(INGREDIENTS))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def publish_coverage_changes(sender, instance, raw=False, **kwargs):
+    """Сообщает индексу покрытия об изменении рецепта после коммита."""
+    if raw:
+        return
+    # После удаления Django обнуляет pk экземпляра.
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: publish_recipe_changes((recipe_id,)))
@@ -0,0 +1,391 @@
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.importer import RecipeImporter
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.search import update_search_vectors
+from users.models import Follow, FoodUser
+
+# Подсчет, рецепты с флагами, теги, ингредиенты с названиями.
+LIST_QUERIES = 4
+# Рецепт с флагами, теги, ингредиенты с названиями.
+DETAIL_QUERIES = 3
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class RecipeQueryCountTest(TestCase):
+    """Число запросов рецептов не зависит от размера страницы и состава."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = FoodUser.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Reader', last_name='Test', password='Pass-12345',
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag-{number}',
+            )
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(5)
+        ]
+        cls.authors = {}
+        for count in (1, 5):
+            author = FoodUser.objects.create_user(
+                email=f'author{count}@example.com', username=f'author{count}',
+                first_name='Author', last_name='Test', password='Pass-12345',
+            )
+            cls.authors[count] = author
+            for number in range(6):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'Рецепт {number}', text='Текст',
+                    cooking_time=10,
+                )
+                recipe.tags.set(tags)
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(
+                        recipe=recipe, ingredient=ingredient, amount=100
+                    )
+                    for ingredient in ingredients[:count]
+                )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_query_count(self):
+        for count, author in self.authors.items():
+            for limit in (2, 6):
+                with self.subTest(ingredients=count, limit=limit):
+                    with self.assertNumQueries(LIST_QUERIES):
+                        response = self.client.get(
+                            '/api/recipes/',
+                            {'author': author.id, 'limit': limit},
+                        )
+                    results = response.json()['results']
+                    self.assertEqual(len(results), limit)
+                    self.assertEqual(
+                        len(results[0]['ingredients']), count
+                    )
+
+    def test_detail_query_count(self):
+        for count, author in self.authors.items():
+            recipe = author.recipes.first()
+            with self.subTest(ingredients=count):
+                with self.assertNumQueries(DETAIL_QUERIES):
+                    response = self.client.get(f'/api/recipes/{recipe.id}/')
+                self.assertEqual(len(response.json()['ingredients']), count)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class RecipeUpdateTest(TestCase):
+    """Изменение рецепта сбрасывает закэшированные ответы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = FoodUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Test', password='Pass-12345',
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag-{number}',
+            )
+            for number in range(2)
+        ]
+        cls.salt = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Суп', text='Текст', cooking_time=10,
+        )
+        cls.recipe.tags.set(cls.tags[:1])
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.salt, amount=5
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def patch(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def test_ingredients_only_patch_refreshes_cached_detail(self):
+        detail = self.anonymous.get(self.url).json()
+        self.assertEqual(detail['ingredients'][0]['amount'], 5)
+        self.patch({'ingredients': [{'id': self.salt.id, 'amount': 7}]})
+        detail = self.anonymous.get(self.url).json()
+        self.assertEqual(detail['ingredients'][0]['amount'], 7)
+
+    def test_ingredients_patch_updates_coverage_index(self):
+        pepper = Ingredient.objects.create(name='Перец', measurement_unit='г')
+        cook_url = '/api/recipes/cook/'
+        found = self.anonymous.get(cook_url, {'ingredients': pepper.id})
+        self.assertEqual(found.json(), [])
+        self.patch({'ingredients': [
+            {'id': self.salt.id, 'amount': 5},
+            {'id': pepper.id, 'amount': 1},
+        ]})
+        found = self.anonymous.get(cook_url, {'ingredients': pepper.id})
+        self.assertEqual(
+            [recipe['id'] for recipe in found.json()], [self.recipe.id]
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'вектор есть в PostgreSQL')
+    def test_ingredients_patch_updates_search_vector(self):
+        basil = Ingredient.objects.create(
+            name='Базилик', measurement_unit='г'
+        )
+        self.patch({'ingredients': [{'id': basil.id, 'amount': 3}]})
+        found = self.client.get('/api/recipes/', {'search': 'базилик'})
+        self.assertEqual(
+            [recipe['id'] for recipe in found.json()['results']],
+            [self.recipe.id],
+        )
+
+    def test_ingredients_patch_updates_shopping_list(self):
+        reader = FoodUser.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Reader', last_name='Test', password='Pass-12345',
+        )
+        self.client.force_authenticate(reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{self.url}shopping_cart/')
+        self.client.force_authenticate(self.author)
+        self.patch({'ingredients': [{'id': self.salt.id, 'amount': 8}]})
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=reader).amount, 8
+        )
+
+    def test_unchanged_ingredients_schedule_nothing(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.patch(
+                self.url,
+                {'ingredients': [{'id': self.salt.id, 'amount': 5}]},
+                format='json',
+            )
+        self.assertEqual(callbacks, [])
+
+    def test_tags_only_patch_refreshes_cached_detail(self):
+        self.anonymous.get(self.url)
+        self.patch({'tags': [tag.id for tag in self.tags]})
+        detail = self.anonymous.get(self.url).json()
+        self.assertEqual(len(detail['tags']), 2)
+
+
+class RecipeSearchPaginationTest(TestCase):
+    """Результаты поиска идут по релевантности при любой пагинации."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = FoodUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Test', password='Pass-12345',
+        )
+        cls.by_name = Recipe.objects.create(
+            author=author, name='Борщ', text='Свекла', cooking_time=60,
+        )
+        cls.by_text = Recipe.objects.create(
+            author=author, name='Салат', text='Как Борщ', cooking_time=5,
+        )
+        # Векторы пересчитываются после коммита, которого в тесте нет.
+        update_search_vectors(Recipe.objects.all())
+
+    def test_search_ignores_cursor_pagination(self):
+        for params in ({}, {'pagination': 'cursor'}):
+            with self.subTest(**params):
+                response = self.client.get(
+                    '/api/recipes/', {'search': 'Борщ', **params}
+                )
+                data = response.json()
+                self.assertIn('count', data)
+                self.assertEqual(
+                    [recipe['id'] for recipe in data['results']],
+                    [self.by_name.id, self.by_text.id],
+                )
+
+    def test_cursor_pagination_without_search(self):
+        response = self.client.get(
+            '/api/recipes/', {'pagination': 'cursor'}
+        )
+        data = response.json()
+        self.assertNotIn('count', data)
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']],
+            [self.by_text.id, self.by_name.id],
+        )
+
+
+class CascadeDeleteTest(TestCase):
+    """Каскадное удаление не обрабатывает связанные строки по одной."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            FoodUser.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='User', last_name='Test', password='Pass-12345',
+            )
+            for number in range(30)
+        ]
+
+    def create_recipe(self, author):
+        return Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст', cooking_time=10,
+        )
+
+    def delete_queries(self, model, count):
+        recipe = self.create_recipe(self.users[0])
+        model.objects.bulk_create(
+            model(user=user, recipe=recipe) for user in self.users[:count]
+        )
+        with CaptureQueriesContext(connection) as context:
+            recipe.delete()
+        return len(context)
+
+    def test_recipe_delete_queries_do_not_depend_on_favorites(self):
+        self.assertEqual(
+            self.delete_queries(Favorite, 2),
+            self.delete_queries(Favorite, 30),
+        )
+
+    def test_recipe_delete_queries_do_not_depend_on_carts(self):
+        self.assertEqual(
+            self.delete_queries(ShoppingCart, 2),
+            self.delete_queries(ShoppingCart, 30),
+        )
+
+    def test_recipe_delete_updates_shopping_lists(self):
+        salt, pepper = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Перец')
+        )
+        kept, deleted = (self.create_recipe(self.users[0]) for _ in 'ab')
+        RecipeIngredient.objects.create(recipe=kept, ingredient=salt, amount=2)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=deleted, ingredient=salt, amount=3),
+            RecipeIngredient(recipe=deleted, ingredient=pepper, amount=1),
+        ])
+        for user in self.users[1:4]:
+            for recipe in (kept, deleted):
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+        deleted.delete()
+        self.assertEqual(
+            list(
+                ShoppingListItem.objects.order_by('user_id')
+                .values_list('user_id', 'ingredient_id', 'amount')
+            ),
+            [(user.id, salt.id, 2) for user in self.users[1:4]],
+        )
+
+    def test_user_delete_updates_counters(self):
+        reader, author, other = self.users[:3]
+        recipes = [self.create_recipe(author) for _ in range(2)]
+        for recipe in recipes:
+            Favorite.objects.create(user=reader, recipe=recipe)
+            Favorite.objects.create(user=other, recipe=recipe)
+        Follow.objects.create(user=reader, following=author)
+        Follow.objects.create(user=other, following=author)
+        reader.delete()
+        self.assertEqual(
+            [recipe.favorites_count for recipe in author.recipes.all()],
+            [1, 1],
+        )
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+
+
+class RecipeExportTest(TestCase):
+    """Выгрузка рецептов загружается обратно без изменений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = FoodUser.objects.create_user(
+            email='admin@example.com', username='admin',
+            first_name='Admin', last_name='Test', password='Pass-12345',
+            is_staff=True,
+        )
+        cls.copier = FoodUser.objects.create_user(
+            email='copier@example.com', username='copier',
+            first_name='Copier', last_name='Test', password='Pass-12345',
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag-{number}',
+            )
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.admin, name=f'Рецепт {number}',
+                text=f'Текст "{number}"', cooking_time=number + 1,
+            )
+            recipe.tags.set(tags[:number])
+            for amount, ingredient in enumerate(
+                ingredients[:number + 1], 1
+            ):
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def export(self, author):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(
+            '/api/recipes/export/', {'author': author.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_export_round_trip(self):
+        lines = self.export(self.admin)
+        self.assertEqual(len(lines), 3)
+        importer = RecipeImporter(self.copier, batch_size=2).run(lines)
+        self.assertEqual((importer.created, importer.failed), (3, 0))
+        self.assertEqual(self.export(self.copier), lines)
+
+    def test_export_requires_staff(self):
+        self.client.force_authenticate(self.copier)
+        response = self.client.get('/api/recipes/export/')
+        self.assertEqual(response.status_code, 403)
@@ -1,82 +1,174 @@
-import io
+from django.conf import settings
 from django.contrib.auth.hashers import check_password
-from django.db.models import Sum
+from django.db import IntegrityError, transaction
 from django_filters import rest_framework as filters
-from django.http import FileResponse
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from .cache import (
+    catalog_etag,
+    get_cached_response,
+    recipes_cache_key,
+    set_cached_response,
+)
+from .mixins import ConditionalCatalogMixin, CursorPaginationMixin
+from .parsers import NDJSONParser
+from .renderers import (
+    CSVShoppingListRenderer,
+    PDFShoppingListRenderer,
+    TextShoppingListRenderer,
+)
+from .search import ingredient_index, recipe_coverage_index
 from .serializers import (
+    CoverageRecipeSerializer,
     FavoriteRecipeSerializer,
     FoodUserSerializer,
     FollowSerializer,
     FollowSubSerializer,
     IngredientSerializer,
+    PantrySerializer,
     TagSerializer,
     RecipeWriteSerializer,
+    RecipeIdsSerializer,
     RecipeReadSerializer,
+    ShoppingListItemSerializer,
+    SimilarRecipeSerializer,
+    get_recipes_limit,
+)
+from .shopping_list import (
+    ExportBusy,
+    get_ingredient_totals,
+    iter_csv,
+    iter_text,
+    render_pdf,
 )
 from api.filters import IngredientFilter, RecipeFilter
 from api.permissions import IsAuthorOrReadOnly
+from core.cache import INGREDIENTS, TAGS
+from core.db import delete_returning, insert_returning, supports_returning
+from core.paginators import FeedCursorPagination, FollowCursorPagination
+from recipes.bulk import add_recipes, remove_recipes
+from recipes.exporter import iter_ndjson
+from recipes.importer import RecipeImporter
+from recipes.counters import change_counter
 from recipes.models import (
     Ingredient,
     Favorite,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
+    SimilarRecipe,
     Tag,
-    RecipeIngredient
 )
-from users.models import FoodUser
+from users.models import Follow, FoodUser
 
 
-class UserViewSet(DjoserUserViewSet):
+class UserViewSet(CursorPaginationMixin, DjoserUserViewSet):
     """Вьюсет для работы с пользователями."""
 
     serializer_class = FoodUserSerializer
     queryset = FoodUser.objects.all()
     http_method_names = ('get', 'post', 'delete')
+    lookup_value_regex = r'\d+'
 
     def get_permissions(self):
         if self.action in ('me', 'subscriptions', 'subscribe'):
             return (permissions.IsAuthenticated(),)
         return (permissions.AllowAny(),)
 
+    def get_cursor_pagination_class(self):
+        if self.action == 'subscriptions':
+            return FollowCursorPagination
+        return None
+
     @action(detail=False, methods=('get',))
     def subscriptions(self, request):
         """Возвращает подписки."""
         user = self.request.user
-        following = user.subscriber.all()
+        recipes_limit = get_recipes_limit(request)
+        following = (
+            user.subscriber.select_related('following').order_by('-id')
+        )
         pages = self.paginate_queryset(following)
+        recipes_by_author = Recipe.objects.latest_by_authors(
+            [follow.following_id for follow in pages], recipes_limit
+        )
         serializer = FollowSerializer(
-            pages, many=True, context={'request': request}
+            pages, many=True, context={
+                'request': request,
+                'recipes_by_author': recipes_by_author,
+            }
         )
         return self.get_paginated_response(serializer.data)
 
+    @staticmethod
+    def add_follow(user, author):
+        """
+        Создает подписку одним INSERT ... ON CONFLICT DO NOTHING.
+
+        Возвращает подписку или None, если она уже была, в том числе
+        создана параллельным запросом.
+        """
+        if supports_returning():
+            created = insert_returning(
+                Follow,
+                [{'user_id': user.id, 'following_id': author.id}],
+                'id',
+            )
+            if not created:
+                return None
+            change_counter(FoodUser, 'followers_count', (author.id,))
+            return Follow(id=created[0], user=user, following=author)
+        try:
+            with transaction.atomic():
+                return Follow.objects.create(user=user, following=author)
+        except IntegrityError:
+            return None
+
     @action(detail=True, methods=('post', 'delete'))
+    @transaction.atomic
     def subscribe(self, request, id=None):
         """Метод для подписки и отписки от авторов."""
-        author = get_object_or_404(FoodUser, id=id)  # Изменил на модель User
         user = self.request.user
         if request.method == 'POST':
-            serializer = FollowSubSerializer(
-                data={'user': user.id, 'following': author.id},
-                context={'request': request}
+            author = get_object_or_404(FoodUser.objects.only('id'), id=id)
+            if author.id == user.id:
+                raise ValidationError(
+                    {'errors': 'Вы не можете подписаться на себя.'}
+                )
+            follow = self.add_follow(user, author)
+            if follow is None:
+                raise ValidationError(
+                    {'errors': 'Вы уже подписаны на этого пользователя.'}
+                )
+            return Response(
+                FollowSubSerializer(follow).data,
+                status=status.HTTP_201_CREATED,
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            user = request.user
-            subscribe_instance = user.subscriber.filter(following=author)
-            if subscribe_instance.exists():
-                subscribe_instance.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-        raise ValidationError({'detail': 'Неверный метод запроса.'})
+        subscription = user.subscriber.filter(following_id=id)
+        if supports_returning():
+            unfollowed = delete_returning(subscription, 'following_id')
+        else:
+            unfollowed = list(
+                subscription.select_for_update()
+                .values_list('following_id', flat=True)
+            )
+            subscription.delete()
+        # У подписок нет обработчиков удаления, счетчик меняется здесь.
+        change_counter(FoodUser, 'followers_count', unfollowed, -1)
+        if unfollowed:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(FoodUser, id=id)
+        raise ValidationError(
+            {'errors': 'Вы не подписаны на этого пользователя.'}
+        )
 
     @action(detail=False, methods=('post',))
     def set_password(self, request):
@@ -91,13 +183,15 @@ class UserViewSet(DjoserUserViewSet):
         if not check_password(current_password, user.password):
             raise ValidationError('Текущий пароль неверен.')
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=('password',))
         return Response({'detail': 'Пароль успешно изменен.'})
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalCatalogMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Вьюсет для работы с ингредиентами."""
 
+    catalog_name = INGREDIENTS
     permission_classes = (AllowAny,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -105,10 +199,22 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        """Ищет ингредиенты по началу названия без обращения к БД."""
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            catalog_etag(self.catalog_name, request),
+            lambda request: Response(ingredient_index.search(name)),
+            request,
+        )
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(ConditionalCatalogMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для работы с тегами."""
 
+    catalog_name = TAGS
     permission_classes = (AllowAny,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -116,18 +222,71 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     http_method_names = ('get',)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами."""
 
+    cursor_pagination_class = FeedCursorPagination
     permission_classes = (IsAuthorOrReadOnly,)
     http_method_names = ('get', 'post', 'patch', 'delete')
     serializer_class = RecipeWriteSerializer
-    queryset = (
-        Recipe.objects.select_related('author')
-        .prefetch_related('tags', 'ingredients').all()
-    )
+    queryset = Recipe.objects.with_related()
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        """Добавляет к рецептам флаги избранного и списка покупок."""
+        return super().get_queryset().with_user_flags(self.request.user)
+
+    def is_trending(self):
+        return self.request.query_params.get('ordering') == 'trending'
+
+    def is_search(self):
+        return bool(self.request.query_params.get('search', '').strip())
+
+    def get_cursor_pagination_class(self):
+        """
+        Популярные рецепты и результаты поиска листаются по страницам.
+
+        Курсор держит только порядок публикации и заменил бы им
+        сортировку по популярности или релевантности.
+        """
+        if self.is_trending() or self.is_search():
+            return None
+        return super().get_cursor_pagination_class()
+
+    def list(self, request, *args, **kwargs):
+        """
+        Отдает анонимным пользователям список рецептов из кэша.
+
+        Избранное и списки покупок не сбрасывают кэш рецептов, поэтому
+        популярные рецепты кэшируются на TRENDING_CACHE_TIMEOUT.
+        """
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = recipes_cache_key(request, 'list')
+        data = get_cached_response(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            set_cached_response(
+                key, response.data,
+                settings.TRENDING_CACHE_TIMEOUT if self.is_trending()
+                else None,
+            )
+            return response
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Отдает анонимным пользователям рецепт из кэша."""
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        key = recipes_cache_key(request, 'detail', pk=kwargs['pk'])
+        data = get_cached_response(key)
+        if data is None:
+            response = super().retrieve(request, *args, **kwargs)
+            set_cached_response(key, response.data)
+            return response
+        return Response(data)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -140,81 +299,296 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'favorite',
             'shopping_cart',
             'download_shopping_cart',
+            'shopping_list',
+            'favorite_bulk',
+            'shopping_cart_bulk',
+            'feed',
         ):
             return (permissions.IsAuthenticated(),)
+        if self.action in ('import_recipes', 'export_recipes'):
+            return (permissions.IsAdminUser(),)
         return (IsAuthorOrReadOnly(),)
 
+    @staticmethod
+    def change_recipe(request, pk, model, exists_message, absent_message):
+        """
+        Добавляет рецепт в список пользователя или удаляет из него.
+
+        Запись выполняется одним INSERT или DELETE, а ответ 201/204,
+        400 или 404 определяется по его результату.
+        """
+        if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, pk=pk)
+            if not add_recipes(model, request.user, (recipe.id,)):
+                raise ValidationError({'errors': exists_message})
+            serializer = FavoriteRecipeSerializer(
+                recipe, context={'request': request}
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if remove_recipes(model, request.user, (pk,)):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=pk)
+        raise ValidationError({'errors': absent_message})
+
     @action(detail=True, methods=('post', 'delete'),
             permission_classes=(permissions.IsAuthenticated,))
     def favorite(self, request, pk=None):
         """Метод для добавления и удаления рецепта в избранное."""
-        user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        serializer = FavoriteRecipeSerializer(
-            recipe,
-            data=request.data,
-            context={
-                'request': request,
-                'action_name': 'favorite'
-            }
+        return self.change_recipe(
+            request, pk, Favorite,
+            'Рецепт уже в избранном.',
+            'Рецепта нет в избранном.',
         )
-        if request.method == 'POST':
-            if serializer.is_valid():
-                Favorite.objects.create(user=user, recipe=recipe)
-                return Response(
-                    serializer.data, status=status.HTTP_201_CREATED
-                )
-        if request.method == 'DELETE':
-            Favorite.objects.filter(user=user, recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=('post', 'delete'),
             permission_classes=(permissions.IsAuthenticated,))
     def shopping_cart(self, request, pk=None):
         """Метод для добавления и удаления рецепта в список покупок."""
-        recipe = get_object_or_404(Recipe, pk=pk)
-        user = request.user
-        serializer = FavoriteRecipeSerializer(
-            recipe,
-            data=request.data,
-            context={
-                'request': request,
-                'action_name': 'shopping_cart'
-            }
+        return self.change_recipe(
+            request, pk, ShoppingCart,
+            'Рецепт уже в списке покупок.',
+            'Рецепта нет в списке покупок.',
         )
-        if request.method == 'POST' and serializer.is_valid():
-            ShoppingCart.objects.create(user=user, recipe=recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if request.method == 'DELETE':
-            ShoppingCart.objects.filter(user=user, recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+    @staticmethod
+    def change_recipes_bulk(request, model):
+        """
+        Добавляет или удаляет несколько рецептов за один запрос.
+
+        Возвращает результат для каждого id: added или exists при
+        добавлении, removed или absent при удалении, not_found для
+        несуществующих рецептов.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        found = set(
+            Recipe.objects.filter(pk__in=recipe_ids)
+            .values_list('pk', flat=True)
+        )
+        valid_ids = [pk for pk in recipe_ids if pk in found]
+        if request.method == 'POST':
+            changed = add_recipes(model, request.user, valid_ids)
+            done, skipped = 'added', 'exists'
+        else:
+            changed = remove_recipes(model, request.user, valid_ids)
+            done, skipped = 'removed', 'absent'
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in found
+                    else done if pk in changed
+                    else skipped
+                ),
+            }
+            for pk in recipe_ids
+        ]})
+
+    @action(detail=False, methods=('post', 'delete'), url_path='favorite',
+            permission_classes=(permissions.IsAuthenticated,))
+    def favorite_bulk(self, request):
+        """Добавляет или удаляет несколько рецептов в избранном."""
+        return self.change_recipes_bulk(request, Favorite)
+
+    @action(detail=False, methods=('post', 'delete'),
+            url_path='shopping_cart',
+            permission_classes=(permissions.IsAuthenticated,))
+    def shopping_cart_bulk(self, request):
+        """Добавляет или удаляет несколько рецептов в списке покупок."""
+        return self.change_recipes_bulk(request, ShoppingCart)
+
+    @action(detail=False, methods=('post',), url_path='import',
+            permission_classes=(permissions.IsAdminUser,),
+            parser_classes=(NDJSONParser,))
+    def import_recipes(self, request):
+        """
+        Загружает рецепты из тела запроса в формате NDJSON.
+
+        Автором рецептов становится текущий пользователь. Ошибочные
+        строки пропускаются и возвращаются в errors.
+        """
+        importer = RecipeImporter(
+            request.user,
+            batch_size=settings.RECIPE_IMPORT_BATCH_SIZE,
+            max_errors=settings.RECIPE_IMPORT_MAX_ERRORS,
+        ).run(request.data)
+        return Response({
+            'created': importer.created,
+            'failed': importer.failed,
+            'errors': importer.errors,
+        })
+
+    @action(detail=False, methods=('get',), url_path='export',
+            permission_classes=(permissions.IsAdminUser,))
+    def export_recipes(self, request):
+        """
+        Выгружает рецепты в NDJSON потоковым ответом.
+
+        Формат совпадает с форматом импорта. Принимает те же фильтры,
+        что и список рецептов, например ?author=.
+        """
+        recipes = self.filter_queryset(Recipe.objects.all())
+        response = StreamingHttpResponse(
+            iter_ndjson(recipes, settings.RECIPE_IMPORT_BATCH_SIZE),
+            content_type='application/x-ndjson; charset=utf-8',
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"'
+        )
+        return response
 
     @action(detail=False, methods=('get',),
             permission_classes=(permissions.IsAuthenticated,))
-    def download_shopping_cart(self, request):
-        user = request.user
-        ingredient_totals = (
-            RecipeIngredient.objects
-            .filter(recipe__shoppingcart__user=user)
-            .values(
-                'ingredient__name',
-                'ingredient__measurement_unit'
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+
+        Всегда листается по курсору в порядке публикации. С ?short=1
+        рецепты отдаются в кратком виде, иначе полностью с флагами
+        избранного и списка покупок, посчитанными в том же запросе.
+        """
+        if request.query_params.get('short') in ('1', 'true'):
+            queryset = Recipe.objects.only(
+                'id', 'name', 'image', 'cooking_time', 'pub_date'
             )
-            .annotate(amount=Sum('amount'))
+            serializer_class = FavoriteRecipeSerializer
+        else:
+            queryset = self.get_queryset()
+            serializer_class = RecipeReadSerializer
+        paginator = FeedCursorPagination()
+        page = paginator.paginate_queryset(
+            queryset.feed(request.user), request, view=self
+        )
+        return paginator.get_paginated_response(serializer_class(
+            page, many=True, context=self.get_serializer_context()
+        ).data)
+
+    @action(detail=False, methods=('get',), url_path='cook')
+    def cook(self, request):
+        """
+        Подбирает рецепты по имеющимся ингредиентам.
+
+        Принимает ?ingredients=1,2,3 и ?limit=. Рецепты ранжируются
+        индексом покрытия в памяти процесса, из базы читаются только
+        найденные рецепты и их недостающие ингредиенты.
+        """
+        data = {'ingredients': [
+            value
+            for param in request.query_params.getlist('ingredients')
+            for value in param.split(',') if value
+        ]}
+        if 'limit' in request.query_params:
+            data['limit'] = request.query_params['limit']
+        serializer = PantrySerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        rows = recipe_coverage_index.search(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data['limit'],
+        )
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'cooking_time'
+        ).in_bulk([row['id'] for row in rows])
+        ingredients = Ingredient.objects.in_bulk(
+            {pk for row in rows for pk in row['missing']}
         )
+        found = []
+        for row in rows:
+            # Рецепт могли удалить, пока индекс не обновился.
+            recipe = recipes.get(row['id'])
+            if recipe is None:
+                continue
+            recipe.matched_count = row['matched_count']
+            recipe.ingredients_count = row['ingredients_count']
+            recipe.missing_ingredients = [
+                ingredients[pk] for pk in row['missing']
+                if pk in ingredients
+            ]
+            found.append(recipe)
+        return Response(CoverageRecipeSerializer(
+            found, many=True, context={'request': request}
+        ).data)
 
-        content = 'Список ингредиентов для покупок:\n'
-        for ingredient in ingredient_totals:
-            content += (
-                f'{ingredient["ingredient__name"]} '
-                f'({ingredient["ingredient__measurement_unit"]}) '
-                f'- {ingredient["amount"]}\n'
+    @action(detail=True, methods=('get',))
+    def similar(self, request, pk=None):
+        """
+        Отдает похожие рецепты, рассчитанные build_similar_recipes.
+
+        Рецепты читаются одним запросом из готовой таблицы по убыванию
+        сходства.
+        """
+        rows = list(
+            SimilarRecipe.objects.filter(recipe_id=pk)
+            .select_related('similar')
+            .only(
+                'score', 'similar__id', 'similar__name',
+                'similar__image', 'similar__cooking_time',
             )
-        response = FileResponse(
-            io.BytesIO(content.encode('utf-8')),
-            as_attachment=True,
-            filename='ShoppingList.txt',
-            content_type='text/plain'
+            .order_by('-score', 'similar_id')
+            [:settings.SIMILAR_RECIPES_COUNT]
+        )
+        if not rows:
+            get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        recipes = []
+        for row in rows:
+            row.similar.score = row.score
+            recipes.append(row.similar)
+        return Response(SimilarRecipeSerializer(
+            recipes, many=True, context={'request': request}
+        ).data)
+
+    @action(detail=False, methods=('get',),
+            permission_classes=(permissions.IsAuthenticated,))
+    def shopping_list(self, request):
+        """Отдает итоговый список покупок пользователя."""
+        items = (
+            ShoppingListItem.objects
+            .filter(user=request.user)
+            .select_related('ingredient')
+            .order_by('ingredient__name', 'ingredient__measurement_unit')
+        )
+        return Response(ShoppingListItemSerializer(items, many=True).data)
+
+    @action(detail=False, methods=('get',),
+            permission_classes=(permissions.IsAuthenticated,),
+            renderer_classes=(
+                TextShoppingListRenderer,
+                CSVShoppingListRenderer,
+                PDFShoppingListRenderer,
+                JSONRenderer,
+            ))
+    def download_shopping_cart(self, request):
+        """
+        Отдает список покупок в формате txt, csv или pdf.
+
+        Клиентам, запросившим JSON, как и раньше отдается текст.
+        """
+        file_format = request.accepted_renderer.format
+        if file_format == 'pdf':
+            try:
+                file = render_pdf(request.user)
+            except ExportBusy:
+                return Response(
+                    {'detail': 'Сервер занят, повторите запрос позже.'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': '5'},
+                )
+            return FileResponse(
+                file,
+                as_attachment=True,
+                filename='ShoppingList.pdf',
+                content_type='application/pdf'
+            )
+        rows = get_ingredient_totals(request.user)
+        if file_format == 'csv':
+            content, content_type = iter_csv(rows), 'text/csv'
+        else:
+            file_format = 'txt'
+            content, content_type = iter_text(rows), 'text/plain'
+        response = StreamingHttpResponse(
+            content, content_type=f'{content_type}; charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="ShoppingList.{file_format}"'
         )
         return response
@@ -0,0 +1,65 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import locks
+
+RECIPES = 'recipes'
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+COVERAGE = 'coverage'
+
+# Сколько секунд изменения рецептов для индекса покрытия хранятся в кэше.
+COVERAGE_CHANGES_TIMEOUT = 24 * 60 * 60
+
+
+def get_version(name):
+    """Возвращает текущую версию набора данных name."""
+    key = f'{name}:version'
+    version = cache.get(key)
+    if version is None:
+        # Новая версия не должна совпасть с вытесненной из кэша.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Меняет версию набора данных name и возвращает новую версию."""
+    key = f'{name}:version'
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
+
+
+def bump_recipes_version():
+    """Делает недействительными все закэшированные ответы рецептов."""
+    bump_version(RECIPES)
+
+
+def publish_recipe_changes(recipe_ids):
+    """
+    Сообщает процессам об изменении ингредиентов рецептов recipe_ids.
+
+    Вызывается после фиксации транзакции, чтобы процессы прочитали уже
+    сохраненные данные. Версия и список изменений записываются под
+    файловой блокировкой: в FileBasedCache и DatabaseCache incr - это
+    чтение и запись, и без блокировки два процесса получили бы одну
+    версию и затерли изменения друг друга.
+    """
+    with open(
+        os.path.join(settings.LOCK_DIR, 'foodgram-coverage.lock'), 'a'
+    ) as file:
+        locks.lock(file, locks.LOCK_EX)
+        try:
+            version = bump_version(COVERAGE)
+            cache.set(
+                f'{COVERAGE}:changes:{version}', list(recipe_ids),
+                COVERAGE_CHANGES_TIMEOUT,
+            )
+        finally:
+            locks.unlock(file)
@@ -9,3 +9,13 @@ CHAR_FIELD_LENGTH_COLOR = 7
 EMAIL_FIELD_LENGTH = 254
 
 MIN_VALUE_COOKING_TIME_AND_AMOUNT = 1
+
+PAGE_SIZE = 6
+
+MAX_PAGE_SIZE = 100
+
+MAX_RECIPES_LIMIT = 20
+
+MAX_BULK_RECIPES = 100
+
+MAX_PANTRY_INGREDIENTS = 100
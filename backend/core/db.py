@@ -0,0 +1,58 @@
+from django.db import connections
+from django.db.models import sql
+
+
+def supports_returning(using='default'):
+    """Поддерживает ли СУБД RETURNING в INSERT и DELETE."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return True
+    return (
+        connection.vendor == 'sqlite'
+        and connection.Database.sqlite_version_info >= (3, 35)
+    )
+
+
+def insert_returning(model, rows, returning, using='default'):
+    """
+    Вставляет строки одним INSERT ... ON CONFLICT DO NOTHING.
+
+    rows - список словарей {attname: значение} с одинаковыми ключами.
+    Возвращает значения поля returning только у вставленных строк.
+    """
+    if not rows:
+        return []
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = list(rows[0])
+    placeholders = '({})'.format(', '.join(['%s'] * len(fields)))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING '
+            'RETURNING {}'.format(
+                quote(model._meta.db_table),
+                ', '.join(quote(field) for field in fields),
+                ', '.join([placeholders] * len(rows)),
+                quote(returning),
+            ),
+            [row[field] for row in rows for field in fields],
+        )
+        return [value for value, in cursor.fetchall()]
+
+
+def delete_returning(queryset, returning):
+    """
+    Удаляет строки queryset одним DELETE ... RETURNING.
+
+    Сигналы и каскадное удаление в Django не выполняются, поэтому
+    подходит только для таблиц, на которые нет внешних ключей.
+    """
+    query = queryset.query.chain(sql.DeleteQuery)
+    sql_string, params = query.get_compiler(queryset.db).as_sql()
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{sql_string} RETURNING {connection.ops.quote_name(returning)}',
+            params,
+        )
+        return [value for value, in cursor.fetchall()]
@@ -0,0 +1,51 @@
+from django.contrib.postgres.indexes import PostgresIndex
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently as PostgresAddIndexConcurrently,
+)
+
+
+class AddIndexConcurrently(PostgresAddIndexConcurrently):
+    """
+    Создает индекс CONCURRENTLY на PostgreSQL и обычным образом на других СУБД.
+
+    postgres_sql позволяет создать индекс на PostgreSQL собственным
+    запросом, например с классами операторов для выражений. Индексы
+    PostgreSQL (GIN и другие) на остальных СУБД не создаются.
+    """
+
+    def __init__(self, model_name, index, postgres_sql=None):
+        super().__init__(model_name, index)
+        self.postgres_sql = postgres_sql
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            if not isinstance(self.index, PostgresIndex):
+                schema_editor.add_index(model, self.index)
+            return
+        self._ensure_not_in_transaction(schema_editor)
+        if self.postgres_sql:
+            schema_editor.execute(self.postgres_sql)
+        else:
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            if not isinstance(self.index, PostgresIndex):
+                schema_editor.remove_index(model, self.index)
+            return
+        self._ensure_not_in_transaction(schema_editor)
+        schema_editor.remove_index(model, self.index, concurrently=True)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        if self.postgres_sql is not None:
+            kwargs['postgres_sql'] = self.postgres_sql
+        return name, args, kwargs
@@ -1,8 +1,67 @@
-from rest_framework.pagination import PageNumberPagination
+from django.db import connection
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from core.consts import MAX_PAGE_SIZE, PAGE_SIZE
+
+
+def approximate_count(queryset):
+    """Оценка количества строк по статистике планировщика PostgreSQL."""
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
 
 
 class Pagination(PageNumberPagination):
     """Класс пагинации."""
 
     page_size_query_param = 'limit'
-    page_size = 6
+    page_size = PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+
+
+class FeedCursorPagination(CursorPagination):
+    """
+    Пагинация ленты по курсору без COUNT(*) и OFFSET.
+
+    Включается параметром ?pagination=cursor. Параметр ?count=approx
+    добавляет в ответ приблизительное количество записей.
+
+    Порядок ordering заменяет сортировку queryset, поэтому запросы со
+    своим порядком (поиск, популярные рецепты) представление листает
+    по страницам.
+    """
+
+    page_size_query_param = 'limit'
+    page_size = PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get('count') == 'approx':
+            self.count = approximate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+        return response
+
+
+class FollowCursorPagination(FeedCursorPagination):
+    """Пагинация подписок по курсору."""
+
+    ordering = ('-id',)
+
+
+def is_cursor_requested(request):
+    """Проверяет, запросил ли клиент пагинацию по курсору."""
+    return (
+        'cursor' in request.query_params
+        or request.query_params.get('pagination') == 'cursor'
+    )
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# Путь файла внутри каталога загрузки: ab/cd/abcd...(64 символа).ext
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, называющее файлы по хэшу содержимого.
+
+    Файл сохраняется как <каталог>/ab/cd/<sha256>.<расширение>, где ab
+    и cd - первые символы хэша, поэтому в одном каталоге не скапливаются
+    сотни тысяч файлов. Одинаковое содержимое хранится один раз, а
+    содержимое файла по одному адресу никогда не меняется. Файлы не
+    удаляются вместе с объектами: их может использовать несколько
+    записей, поэтому ненужные файлы удаляет команда
+    collect_media_garbage. У повторно загруженного файла обновляется
+    время изменения, чтобы команда не удалила его как старый.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        try:
+            # Повторно используемый файл становится свежим, иначе
+            # collect_media_garbage может удалить его как старый.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+        return name
+
+    @staticmethod
+    def hashed_name(name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hash_value = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(
+            directory, hash_value[:2], hash_value[2:4],
+            hash_value + extension,
+        )
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -73,6 +74,67 @@ DATABASES = {
     }
 }
 
+if os.getenv('USE_SQLITE', False) == 'True':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    }
+}
+
+RECIPES_CACHE_TIMEOUT = int(os.getenv('RECIPES_CACHE_TIMEOUT', 60 * 60))
+
+CATALOG_CACHE_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', 60))
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+SHOPPING_LIST_CHUNK_SIZE = 2000
+
+# Сколько PDF могут формироваться одновременно во всех процессах.
+PDF_EXPORT_WORKERS = int(os.getenv('PDF_EXPORT_WORKERS', 2))
+
+# Каталог файлов блокировок, общих для процессов на хосте.
+LOCK_DIR = os.getenv('LOCK_DIR', tempfile.gettempdir())
+
+PDF_EXPORT_SPOOL_SIZE = 1024 * 1024
+
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', 5 * 1024 * 1024))
+
+MAX_IMAGE_SIDE = int(os.getenv('MAX_IMAGE_SIDE', 6000))
+
+# Ширина уменьшенных копий изображений рецептов.
+IMAGE_VARIANTS = {
+    'small': 320,
+    'medium': 960,
+}
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+RECIPE_IMPORT_BATCH_SIZE = 1000
+
+RECIPE_IMPORT_MAX_ERRORS = 1000
+
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 10))
+
+# За сколько часов популярность рецепта уменьшается вдвое. После
+# изменения нужно выполнить update_trending --rebuild.
+TRENDING_HALF_LIFE = float(os.getenv('TRENDING_HALF_LIFE', 24))
+
+TRENDING_CACHE_TIMEOUT = int(os.getenv('TRENDING_CACHE_TIMEOUT', 60))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -105,6 +167,8 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.FoodUser'
@@ -1,12 +1,15 @@
 from django.contrib import admin
 
+from recipes.bulk import delete_list_rows
 from recipes.models import (
     Ingredient,
     Recipe,
     RecipeIngredient,
     Tag,
     Favorite,
-    ShoppingCart
+    ShoppingCart,
+    ShoppingListItem,
+    SimilarRecipe,
 )
 
 
@@ -56,15 +59,16 @@ class RecipeAdmin(admin.ModelAdmin):
         'display_ingredients',
         'display_tags',
         'in_favourite_count',
+        'in_carts_count',
     )
     search_fields = ('name',)
     list_filter = ('author', 'name', 'tags')
     ordering = ('name',)
 
+    @admin.display(description='В избранном', ordering='favorites_count')
     def in_favourite_count(self, obj):
         """Количество рецептов в избранном."""
-        return Favorite.objects.filter(recipe=obj).count()
-    in_favourite_count.short_description = 'В избранном'
+        return obj.favorites_count
 
     @admin.display(description='Ингредиенты')
     def display_ingredients(self, recipe):
@@ -93,8 +97,18 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     ordering = ('recipe',)
 
 
+class ListAdmin(admin.ModelAdmin):
+    """Админка списка рецептов, которая обновляет счетчики рецептов."""
+
+    def delete_model(self, request, obj):
+        delete_list_rows(type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_list_rows(queryset)
+
+
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(ListAdmin):
     """Админка избранных рецептов."""
 
     list_display = (
@@ -107,7 +121,7 @@ class FavoriteAdmin(admin.ModelAdmin):
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(ListAdmin):
     """Админка списка покупок."""
 
     list_display = (
@@ -117,3 +131,32 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_filter = ('user',)
     search_fields = ('user',)
     ordering = ('user',)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """Админка итогов списков покупок."""
+
+    list_display = (
+        'id',
+        'user',
+        'ingredient',
+        'amount'
+    )
+    list_select_related = ('user', 'ingredient')
+    search_fields = ('user__username', 'ingredient__name')
+    raw_id_fields = ('user', 'ingredient')
+
+
+@admin.register(SimilarRecipe)
+class SimilarRecipeAdmin(admin.ModelAdmin):
+    """Админка похожих рецептов."""
+
+    list_display = (
+        'recipe',
+        'similar',
+        'score'
+    )
+    list_select_related = ('recipe', 'similar')
+    search_fields = ('recipe__name',)
+    raw_id_fields = ('recipe', 'similar')
@@ -0,0 +1,101 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.functions import Now
+
+from core.db import delete_returning, insert_returning, supports_returning
+from recipes.counters import change_counter
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.totals import change_totals, recipes_amounts
+from recipes.trending import TRENDING_CHANGE
+
+# Счетчик рецепта, который меняется вместе со списком.
+LIST_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+# Отметка для пересчета похожих рецептов и очки популярности, которые
+# записываются тем же UPDATE, что меняет счетчик.
+LIST_CHANGE_VALUES = {'interactions_changed': Now(), **TRENDING_CHANGE}
+
+
+def apply_list_change(model, user_id, recipe_ids, sign):
+    """Обновляет счетчики и итоги покупок пользователя user_id."""
+    if not recipe_ids:
+        return
+    change_counter(
+        Recipe, LIST_COUNTERS[model], recipe_ids, sign,
+        **LIST_CHANGE_VALUES
+    )
+    if model is ShoppingCart:
+        change_totals((user_id,), recipes_amounts(recipe_ids), sign)
+
+
+@transaction.atomic
+def delete_list_rows(queryset):
+    """
+    Удаляет строки избранного или списка покупок queryset.
+
+    У моделей списков нет обработчиков удаления, поэтому счетчики
+    рецептов и итоги покупок меняются здесь, по одному разу на
+    пользователя.
+    """
+    by_user = defaultdict(list)
+    for user_id, recipe_id in queryset.values_list('user_id', 'recipe_id'):
+        by_user[user_id].append(recipe_id)
+    queryset.delete()
+    for user_id, recipe_ids in by_user.items():
+        apply_list_change(queryset.model, user_id, recipe_ids, -1)
+
+
+@transaction.atomic
+def add_recipes(model, user, recipe_ids):
+    """
+    Добавляет рецепты в избранное или список покупок пользователя.
+
+    Возвращает множество рецептов, которых в списке еще не было.
+    Вставка выполняется одним INSERT ... ON CONFLICT DO NOTHING,
+    поэтому повторный или параллельный запрос не падает на
+    ограничении уникальности.
+    """
+    if supports_returning():
+        added = insert_returning(
+            model,
+            [{'user_id': user.id, 'recipe_id': pk} for pk in recipe_ids],
+            'recipe_id',
+        )
+    else:
+        existing = set(
+            model.objects.select_for_update()
+            .filter(user=user, recipe_id__in=recipe_ids)
+            .values_list('recipe_id', flat=True)
+        )
+        added = [pk for pk in recipe_ids if pk not in existing]
+        model.objects.bulk_create(
+            (model(user=user, recipe_id=pk) for pk in added),
+            ignore_conflicts=True,
+        )
+    apply_list_change(model, user.id, added, 1)
+    return set(added)
+
+
+@transaction.atomic
+def remove_recipes(model, user, recipe_ids):
+    """
+    Удаляет рецепты из избранного или списка покупок пользователя.
+
+    Возвращает множество рецептов, которые были в списке.
+    """
+    items = model.objects.filter(user=user, recipe_id__in=recipe_ids)
+    if supports_returning():
+        removed = delete_returning(items, 'recipe_id')
+    else:
+        removed = list(
+            items.select_for_update().values_list('recipe_id', flat=True)
+        )
+        # Без сбора объектов и сигналов: их работу делает
+        # apply_list_change.
+        items._raw_delete(items.db)
+    apply_list_change(model, user.id, removed, -1)
+    return set(removed)
@@ -0,0 +1,50 @@
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, FoodUser
+
+# Счетчик: (модель со счетчиком, поле, модель связи, поле связи).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (FoodUser, 'recipes_count', Recipe, 'author'),
+    (FoodUser, 'followers_count', Follow, 'following'),
+)
+
+
+def change_counter(model, field, ids, sign=1, **values):
+    """
+    Изменяет счетчик field у объектов model с первичными ключами ids.
+
+    Ключи могут повторяться: счетчик изменится на число повторов.
+    values - другие поля, которые записываются тем же UPDATE; если
+    значение - функция, она получает изменение счетчика.
+    """
+    by_delta = {}
+    for pk, count in Counter(ids).items():
+        by_delta.setdefault(count * sign, []).append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.filter(pk__in=pks).update(
+            **{field: Greatest(F(field) + delta, Value(0))},
+            **{
+                name: value(delta) if callable(value) else value
+                for name, value in values.items()
+            },
+        )
+
+
+def actual_count(related_model, related_field):
+    """Подзапрос с фактическим количеством связанных строк."""
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(**{related_field: OuterRef('pk')})
+            .order_by()
+            .values(related_field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
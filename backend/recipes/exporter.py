@@ -0,0 +1,52 @@
+import json
+from collections import defaultdict
+
+from recipes.models import Recipe, RecipeIngredient
+
+
+def iter_ndjson(queryset, batch_size=1000):
+    """
+    Выгружает рецепты queryset в NDJSON в формате RecipeImporter.
+
+    Рецепты читаются пакетами по batch_size по возрастанию id, а их
+    ингредиенты и теги - двумя запросами на пакет, поэтому память не
+    зависит от размера выгрузки. Выгруженный файл загружается обратно
+    командой import_recipes.
+    """
+    queryset = queryset.order_by('id').values(
+        'id', 'name', 'text', 'cooking_time'
+    )
+    last_id = 0
+    while True:
+        recipes = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not recipes:
+            return
+        ids = [recipe['id'] for recipe in recipes]
+        ingredients = defaultdict(list)
+        for recipe_id, name, unit, amount in (
+            RecipeIngredient.objects.filter(recipe_id__in=ids)
+            .order_by('id')
+            .values_list(
+                'recipe_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount',
+            )
+        ):
+            ingredients[recipe_id].append(
+                {'name': name, 'measurement_unit': unit, 'amount': amount}
+            )
+        tags = defaultdict(list)
+        for recipe_id, slug in (
+            Recipe.tags.through.objects.filter(recipe_id__in=ids)
+            .order_by('tag__slug')
+            .values_list('recipe_id', 'tag__slug')
+        ):
+            tags[recipe_id].append(slug)
+        for recipe in recipes:
+            yield json.dumps({
+                'name': recipe['name'],
+                'text': recipe['text'],
+                'cooking_time': recipe['cooking_time'],
+                'tags': tags[recipe['id']],
+                'ingredients': ingredients[recipe['id']],
+            }, ensure_ascii=False) + '\n'
+        last_id = ids[-1]
@@ -0,0 +1,134 @@
+import base64
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageFile, ImageOps
+
+from core.cache import bump_recipes_version
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Сколько символов base64 декодировать за раз при чтении заголовка.
+HEADER_CHUNK = 16 * 1024
+
+WEBP_QUALITY = 80
+
+image_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix='image-variants',
+)
+
+
+def strip_whitespace(data):
+    """Убирает переносы строк и пробелы, допустимые в base64."""
+    return ''.join(data.split())
+
+
+def base64_size(data):
+    """Размер данных после декодирования base64."""
+    data = strip_whitespace(data)
+    return len(data) * 3 // 4 - data.count('=', -2)
+
+
+def base64_dimensions(data):
+    """
+    Размеры изображения по началу строки base64.
+
+    Данные декодируются частями, пока Pillow не разберет заголовок,
+    поэтому большое изображение целиком не декодируется. Возвращает
+    None, если заголовок разобрать не удалось.
+    """
+    # Без пробельных символов части кратны четырем символам base64.
+    data = strip_whitespace(data)
+    parser = ImageFile.Parser()
+    for start in range(0, len(data), HEADER_CHUNK):
+        parser.feed(base64.b64decode(data[start:start + HEADER_CHUNK]))
+        if parser.image is not None:
+            return parser.image.size
+    return None
+
+
+def save_image(image, name, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def make_variants(name):
+    """
+    Создает уменьшенные копии изображения name.
+
+    Для каждого размера из IMAGE_VARIANTS сохраняются JPEG (PNG для
+    изображений с прозрачностью) и WebP. Возвращает {вариант: путь}.
+    """
+    directory = Recipe._meta.get_field('image').upload_to
+    variants = {}
+    with default_storage.open(name) as file, Image.open(file) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = (
+            image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        )
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        for variant, width in settings.IMAGE_VARIANTS.items():
+            root = posixpath.join(directory, variant)
+            copy = image.copy()
+            copy.thumbnail((width, width))
+            if has_alpha:
+                variants[variant] = save_image(
+                    copy, f'{root}.png', 'PNG', optimize=True
+                )
+            else:
+                variants[variant] = save_image(
+                    copy, f'{root}.jpg', 'JPEG',
+                    quality=85, optimize=True, progressive=True,
+                )
+            variants[f'{variant}_webp'] = save_image(
+                copy, f'{root}.webp', 'WEBP',
+                quality=WEBP_QUALITY, method=4,
+            )
+    return variants
+
+
+def build_variants(recipe_id, name):
+    """
+    Создает копии изображения рецепта и сохраняет их пути.
+
+    Если изображение рецепта успели заменить, пути не сохраняются.
+    Файлы, на которые больше не ссылается ни один рецепт, удаляет
+    команда collect_media_garbage.
+    """
+    variants = make_variants(name)
+    variants['source'] = name
+    if Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants=variants
+    ):
+        bump_recipes_version()
+
+
+def run_build_variants(recipe_id, name):
+    try:
+        build_variants(recipe_id, name)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s', name)
+    finally:
+        # Соединение потока пула не закрывается обработчиком запроса.
+        connection.close()
+
+
+def schedule_variants(recipe):
+    """Ставит создание копий изображения в очередь после коммита."""
+    if not recipe.image:
+        return
+    if recipe.image_variants.get('source') == recipe.image.name:
+        return
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: image_executor.submit(run_build_variants, recipe_id, name)
+    )
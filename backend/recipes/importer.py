@@ -0,0 +1,197 @@
+import json
+
+from django.db import DatabaseError, connection, transaction
+
+from core.cache import bump_recipes_version, publish_recipe_changes
+from core.consts import CHAR_FIELD_LENGTH_MIDDLE
+from recipes.counters import change_counter
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.search import update_search_vectors
+from users.models import FoodUser
+
+
+class RecipeLineError(ValueError):
+    """Ошибка в строке файла импорта."""
+
+
+def positive_int(value, field):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise RecipeLineError(f'{field}: нужно целое число больше нуля.')
+    return value
+
+
+class RecipeImporter:
+    """
+    Загружает рецепты из NDJSON: один рецепт в формате JSON на строку.
+
+    Строка выглядит так:
+    {"name": "...", "text": "...", "cooking_time": 30,
+     "tags": ["breakfast"],
+     "ingredients": [{"name": "соль", "measurement_unit": "г",
+                      "amount": 5}]}
+
+    Теги ищутся по slug, ингредиенты - по названию и единице измерения
+    (единицу можно не указывать) в словарях, загруженных один раз.
+    Рецепты, их ингредиенты и теги вставляются пакетами по batch_size
+    строк, каждый пакет в своей транзакции. Ошибочные строки
+    пропускаются и попадают в errors с номером строки.
+    """
+
+    def __init__(self, author, batch_size=1000, max_errors=None):
+        self.author = author
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {}
+        self.ingredient_names = {}
+        # При одинаковых названиях побеждает ингредиент с меньшим id.
+        for pk, name, unit in (
+            Ingredient.objects.order_by('-id')
+            .values_list('id', 'name', 'measurement_unit').iterator()
+        ):
+            self.ingredients[(name.lower(), unit.lower())] = pk
+            self.ingredient_names[name.lower()] = pk
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, lines, progress=None):
+        """Загружает строки lines; progress вызывается после пакета."""
+        chunk = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                chunk.append((number, self.parse(line)))
+            except RecipeLineError as error:
+                self.add_error(number, str(error))
+            if len(chunk) >= self.batch_size:
+                self.save_chunk(chunk)
+                chunk = []
+                if progress:
+                    progress(self)
+        if chunk:
+            self.save_chunk(chunk)
+            if progress:
+                progress(self)
+        return self
+
+    def add_error(self, number, message):
+        self.failed += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append({'line': number, 'error': message})
+
+    def parse(self, line):
+        """Проверяет строку и возвращает рецепт с id тегов и ингредиентов."""
+        try:
+            data = json.loads(line)
+        except ValueError as error:
+            raise RecipeLineError(f'Некорректный JSON: {error}')
+        if not isinstance(data, dict):
+            raise RecipeLineError('Ожидается объект JSON.')
+        name = data.get('name')
+        if not isinstance(name, str) or not name.strip():
+            raise RecipeLineError('name: обязательное поле.')
+        if len(name) > CHAR_FIELD_LENGTH_MIDDLE:
+            raise RecipeLineError(
+                f'name: не длиннее {CHAR_FIELD_LENGTH_MIDDLE} символов.'
+            )
+        text = data.get('text', '')
+        if not isinstance(text, str):
+            raise RecipeLineError('text: ожидается строка.')
+        return {
+            'recipe': Recipe(
+                author=self.author,
+                name=name.strip(),
+                text=text,
+                cooking_time=positive_int(
+                    data.get('cooking_time'), 'cooking_time'
+                ),
+            ),
+            'tags': self.parse_tags(data.get('tags', [])),
+            'ingredients': self.parse_ingredients(data.get('ingredients')),
+        }
+
+    def parse_tags(self, slugs):
+        if not isinstance(slugs, list):
+            raise RecipeLineError('tags: ожидается список slug.')
+        unknown = [slug for slug in slugs if slug not in self.tags]
+        if unknown:
+            raise RecipeLineError('tags: неизвестные теги {}.'.format(
+                ', '.join(map(str, unknown))
+            ))
+        return {self.tags[slug] for slug in slugs}
+
+    def parse_ingredients(self, items):
+        if not isinstance(items, list) or not items:
+            raise RecipeLineError('ingredients: нужен непустой список.')
+        amounts = {}
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(
+                item.get('name'), str
+            ):
+                raise RecipeLineError(
+                    'ingredients: у ингредиента должно быть название.'
+                )
+            name = item['name'].strip().lower()
+            unit = item.get('measurement_unit')
+            pk = (
+                self.ingredient_names.get(name) if unit is None
+                else self.ingredients.get((name, str(unit).strip().lower()))
+            )
+            if pk is None:
+                raise RecipeLineError(
+                    f'ingredients: неизвестный ингредиент {item["name"]}.'
+                )
+            if pk in amounts:
+                raise RecipeLineError(
+                    f'ingredients: ингредиент {item["name"]} повторяется.'
+                )
+            amounts[pk] = positive_int(item.get('amount'), 'amount')
+        return amounts
+
+    def save_chunk(self, chunk):
+        """Сохраняет пакет рецептов в одной транзакции."""
+        recipes = [parsed['recipe'] for _, parsed in chunk]
+        try:
+            with transaction.atomic():
+                self.insert_recipes(recipes)
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(
+                        recipe_id=parsed['recipe'].id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for _, parsed in chunk
+                    for ingredient_id, amount in parsed['ingredients'].items()
+                )
+                Recipe.tags.through.objects.bulk_create(
+                    Recipe.tags.through(
+                        recipe_id=parsed['recipe'].id, tag_id=tag_id
+                    )
+                    for _, parsed in chunk
+                    for tag_id in parsed['tags']
+                )
+                recipe_ids = [recipe.id for recipe in recipes]
+                update_search_vectors(Recipe.objects.filter(pk__in=recipe_ids))
+                transaction.on_commit(bump_recipes_version)
+                transaction.on_commit(
+                    lambda: publish_recipe_changes(recipe_ids)
+                )
+        except DatabaseError as error:
+            for number, _ in chunk:
+                self.add_error(number, f'Ошибка базы данных: {error}')
+        else:
+            self.created += len(recipes)
+
+    def insert_recipes(self, recipes):
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            change_counter(
+                FoodUser, 'recipes_count', [self.author.id] * len(recipes)
+            )
+            return
+        # Без RETURNING bulk_create не заполняет id, а save() сам
+        # обновит счетчик рецептов автора.
+        for recipe in recipes:
+            recipe.save()
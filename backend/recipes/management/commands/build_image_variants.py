@@ -0,0 +1,45 @@
+from django.core.management import BaseCommand
+
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Создает уменьшенные копии изображений рецептов.
+
+    Обрабатывает рецепты, у которых копий нет или они созданы для
+    другого изображения, например загруженные до появления копий или
+    те, чья обработка в фоне завершилась ошибкой.
+
+    Использование:
+    python manage.py build_image_variants --all
+    """
+
+    help = 'Создает уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии у всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = (
+            Recipe.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by('id').values_list('id', 'image', 'image_variants')
+        )
+        built = failed = 0
+        for recipe_id, name, variants in recipes.iterator():
+            if not options['all'] and variants.get('source') == name:
+                continue
+            try:
+                build_variants(recipe_id, name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии созданы: {built}, ошибок: {failed}'
+        ))
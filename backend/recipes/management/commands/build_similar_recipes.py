@@ -0,0 +1,140 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from recipes.models import Recipe, SimilarRecipe
+from recipes.similar import load_interactions
+
+
+class Command(BaseCommand):
+    """
+    Рассчитывает похожие рецепты по избранному и спискам покупок.
+
+    Строит разреженную матрицу пользователь x рецепт и считает
+    косинусное сходство рецептов частями, в каждой из которых не больше
+    --max-pairs пар, поэтому память ограничена независимо от размера
+    базы. Для каждого рецепта сохраняются --top-k самых похожих.
+
+    С --incremental пересчитываются только рецепты, у которых изменилось
+    избранное или списки покупок, рецепты с общими с ними пользователями
+    и рецепты, у которых они были среди похожих.
+
+    Использование:
+    python manage.py build_similar_recipes
+    python manage.py build_similar_recipes --incremental
+    """
+
+    help = 'Рассчитывает похожие рецепты.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k', type=int, default=settings.SIMILAR_RECIPES_COUNT
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Пересчитать только рецепты с изменениями.'
+        )
+        parser.add_argument(
+            '--max-pairs', type=int, default=5_000_000,
+            help='Сколько пар рецептов обрабатывать за раз.'
+        )
+        parser.add_argument(
+            '--max-user-recipes', type=int, default=1000,
+            help='Не учитывать пользователей с большим числом рецептов.'
+        )
+        parser.add_argument(
+            '--min-common', type=int, default=1,
+            help='Сколько общих пользователей нужно похожим рецептам.'
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if options['top_k'] < 1 or options['max_pairs'] < 1:
+            raise CommandError(
+                '--top-k и --max-pairs должны быть больше нуля.'
+            )
+        started = time.monotonic()
+        changed = dict(
+            Recipe.objects.filter(interactions_changed__isnull=False)
+            .values_list('id', 'interactions_changed')
+        )
+        last_old_id = SimilarRecipe.objects.aggregate(
+            last=Max('id')
+        )['last']
+        matrix = load_interactions(options['max_user_recipes'])
+        self.stdout.write(
+            f'Пользователей: {len(matrix.user_ids)}, '
+            f'рецептов: {len(matrix.recipe_ids)}, '
+            f'связей: {len(matrix.user_recipes)}'
+        )
+        if options['incremental']:
+            # Сходство меняется у измененных рецептов, у рецептов с общими
+            # с ними пользователями и у тех, где они были среди похожих.
+            targets = set(changed) | set(
+                SimilarRecipe.objects.filter(similar_id__in=changed)
+                .values_list('recipe_id', flat=True)
+            )
+            positions = np.union1d(
+                matrix.positions(targets),
+                matrix.related(matrix.positions(changed)),
+            )
+            # У рецептов без пользователей похожих больше нет.
+            SimilarRecipe.objects.filter(recipe_id__in=targets).exclude(
+                recipe_id__in=matrix.recipe_ids[positions].tolist()
+            ).delete()
+        else:
+            positions = np.arange(len(matrix.recipe_ids))
+        saved = self.save_neighbors(matrix, positions, options)
+        if not options['incremental'] and last_old_id is not None:
+            # Оставшиеся старые строки принадлежат рецептам, которые
+            # больше никто не добавлял.
+            SimilarRecipe.objects.filter(id__lte=last_old_id).delete()
+        if changed:
+            # Изменения, сделанные во время расчета, остаются отмеченными.
+            Recipe.objects.filter(
+                pk__in=list(changed),
+                interactions_changed__lte=max(changed.values()),
+            ).update(interactions_changed=None)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов пересчитано: {len(positions)}, '
+            f'похожих сохранено: {saved} '
+            f'({time.monotonic() - started:.1f} с)'
+        ))
+
+    def save_neighbors(self, matrix, positions, options):
+        """Пересчитывает и сохраняет похожие рецепты частями."""
+        if not len(positions):
+            return 0
+        saved = done = 0
+        for chunk in matrix.chunks(positions, options['max_pairs']):
+            recipe_ids, similar_ids, scores = matrix.neighbors(
+                chunk, options['top_k'], options['min_common']
+            )
+            with transaction.atomic():
+                SimilarRecipe.objects.filter(
+                    recipe_id__in=matrix.recipe_ids[chunk].tolist()
+                ).delete()
+                SimilarRecipe.objects.bulk_create(
+                    (
+                        SimilarRecipe(
+                            recipe_id=recipe_id,
+                            similar_id=similar_id,
+                            score=score,
+                        )
+                        for recipe_id, similar_id, score in zip(
+                            recipe_ids.tolist(), similar_ids.tolist(),
+                            scores.tolist(),
+                        )
+                    ),
+                    batch_size=options['batch_size'],
+                )
+            saved += len(recipe_ids)
+            done += len(chunk)
+            self.stdout.write(
+                f'Обработано рецептов: {done}/{len(positions)}'
+            )
+        return saved
@@ -0,0 +1,73 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+# Каталоги загрузки изображений рецептов, прежний и текущий.
+RECIPE_DIRS = ('static/recipes', 'recipes')
+
+
+def walk(directory):
+    """Пути всех файлов каталога хранилища, включая вложенные."""
+    if not default_storage.exists(directory):
+        return
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    """
+    Удаляет файлы изображений, на которые не ссылается ни один рецепт.
+
+    Файлы хранилища именуются по содержимому и могут использоваться
+    несколькими рецептами, поэтому при изменении и удалении рецептов
+    они не удаляются. Команда собирает пути изображений и их копий из
+    базы и удаляет остальные файлы каталогов рецептов, измененные
+    раньше --grace минут назад: более свежие могут принадлежать
+    незавершенной загрузке.
+
+    Использование:
+    python manage.py collect_media_garbage --dry-run
+    """
+
+    help = 'Удаляет изображения, не связанные с рецептами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=60)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько файлов будет удалено.'
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        referenced = set()
+        for image, variants in (
+            Recipe.objects.exclude(image='')
+            .values_list('image', 'image_variants').iterator()
+        ):
+            referenced.add(image)
+            referenced.update(variants.values())
+        deadline = started - timedelta(minutes=options['grace'])
+        removed = size = 0
+        for directory in RECIPE_DIRS:
+            for path in walk(directory):
+                if path in referenced:
+                    continue
+                if default_storage.get_modified_time(path) > deadline:
+                    continue
+                removed += 1
+                size += default_storage.size(path)
+                if not options['dry_run']:
+                    default_storage.delete(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов без рецептов: {removed}, '
+            f'{size / (1024 * 1024):.1f} МБ'
+        ))
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from recipes.exporter import iter_ndjson
+from recipes.models import Recipe
+from users.models import FoodUser
+
+
+class Command(BaseCommand):
+    """
+    Выгружает рецепты в файл NDJSON.
+
+    Формат совпадает с форматом import_recipes, поэтому выгрузку можно
+    загрузить обратно, в том числе в другую базу. Изображения, как и
+    при импорте, не выгружаются.
+
+    Использование:
+    python manage.py export_recipes recipes.ndjson
+    python manage.py export_recipes - --author admin@example.com
+    """
+
+    help = 'Выгружает рецепты в файл NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или - для stdout.')
+        parser.add_argument(
+            '--author', help='Выгрузить только рецепты автора с этим email.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['author']:
+            try:
+                author = FoodUser.objects.get(email=options['author'])
+            except FoodUser.DoesNotExist:
+                raise CommandError(
+                    f'Пользователь {options["author"]} не найден.'
+                )
+            recipes = recipes.filter(author=author)
+        lines = iter_ndjson(recipes, options['batch_size'])
+        if options['path'] == '-':
+            count = self.write(lines, sys.stdout)
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as file:
+                count = self.write(lines, file)
+            self.stdout.write(self.style.SUCCESS(
+                f'Выгружено рецептов: {count}'
+            ))
+
+    @staticmethod
+    def write(lines, file):
+        count = 0
+        for count, line in enumerate(lines, 1):
+            file.write(line)
+        return count
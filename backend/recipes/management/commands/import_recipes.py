@@ -0,0 +1,56 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from recipes.importer import RecipeImporter
+from users.models import FoodUser
+
+
+class Command(BaseCommand):
+    """
+    Загружает рецепты из файла NDJSON.
+
+    Каждая строка файла - рецепт в формате JSON (формат описан в
+    recipes.importer.RecipeImporter). Ошибочные строки пропускаются и
+    выводятся с номерами, остальные загружаются пакетами.
+
+    Использование:
+    python manage.py import_recipes recipes.ndjson --author admin@example.com
+    """
+
+    help = 'Загружает рецепты из файла NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или - для stdin.')
+        parser.add_argument(
+            '--author', required=True, help='Email автора рецептов.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            author = FoodUser.objects.get(email=options['author'])
+        except FoodUser.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["author"]} не найден.'
+            )
+        importer = RecipeImporter(author, options['batch_size'])
+        if options['path'] == '-':
+            importer.run(sys.stdin, self.progress)
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as file:
+                    importer.run(file, self.progress)
+            except FileNotFoundError:
+                raise CommandError(f'Файл {options["path"]} не найден.')
+        for error in importer.errors:
+            self.stderr.write(f'Строка {error["line"]}: {error["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {importer.created}, '
+            f'строк с ошибками: {importer.failed}'
+        ))
+
+    def progress(self, importer):
+        self.stdout.write(
+            f'Загружено: {importer.created}, ошибок: {importer.failed}'
+        )
@@ -0,0 +1,258 @@
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError as APIValidationError
+
+from core.cache import INGREDIENTS, bump_version
+from core.consts import CHAR_FIELD_LENGTH_MAX
+from recipes.models import Ingredient, Tag
+
+DATA_DIR = os.path.join(settings.BASE_DIR, 'data')
+
+# Сколько символов JSON читать из файла за раз.
+READ_SIZE = 64 * 1024
+
+# Символы между объектами в массиве JSON и в NDJSON.
+JSON_SEPARATORS = ' \t\r\n,[]'
+
+
+def iter_json(file):
+    """
+    Читает объекты из массива JSON или NDJSON, не загружая файл целиком.
+
+    Файл читается по READ_SIZE символов, каждый объект разбирается,
+    как только целиком оказался в буфере.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = file.read(READ_SIZE), 0
+            eof = not buffer
+            continue
+        try:
+            value, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield value
+
+
+def clean_text(number, field, value):
+    if not isinstance(value, str) or not value.strip():
+        raise CommandError(f'Запись {number}: поле {field} обязательно.')
+    value = value.strip()
+    if len(value) > CHAR_FIELD_LENGTH_MAX:
+        raise CommandError(
+            f'Запись {number}: поле {field} длиннее '
+            f'{CHAR_FIELD_LENGTH_MAX} символов.'
+        )
+    return value
+
+
+class Command(BaseCommand):
+    """
+    Загружает справочники ингредиентов и тегов.
+
+    Ингредиенты читаются потоком из CSV (название, единица измерения)
+    или JSON (массив или NDJSON с полями name и measurement_unit) и
+    добавляются по естественному ключу: уже существующие пропускаются,
+    поэтому команду можно запускать повторно. В PostgreSQL пакеты
+    загружаются через COPY во временную таблицу и переносятся одним
+    INSERT ... ON CONFLICT DO NOTHING. Теги ищутся по slug, у
+    существующих обновляются название и цвет.
+
+    Вся загрузка выполняется в одной транзакции: при ошибке в любой
+    записи справочники остаются прежними.
+
+    Использование:
+    python manage.py load_catalog
+    python manage.py load_catalog --ingredients data/ingredients.json
+    """
+
+    help = 'Загружает справочники ингредиентов и тегов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(DATA_DIR, 'ingredients.csv'),
+            help='Файл CSV или JSON с ингредиентами, - для stdin.'
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'json'),
+            help='Формат файла ингредиентов, по умолчанию по расширению.'
+        )
+        parser.add_argument(
+            '--tags', default=os.path.join(DATA_DIR, 'tags.json'),
+            help='Файл JSON с тегами.'
+        )
+        parser.add_argument(
+            '--no-tags', action='store_true',
+            help='Не загружать теги.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        path = options['ingredients']
+        file_format = options['format'] or (
+            'csv' if path == '-' or path.lower().endswith('.csv')
+            else 'json'
+        )
+        with transaction.atomic():
+            if not options['no_tags']:
+                with self.open_file(options['tags']) as file:
+                    self.load_tags(iter_json(file))
+            with self.open_file(path) as file:
+                rows = (
+                    csv.reader(file) if file_format == 'csv'
+                    else self.json_rows(iter_json(file))
+                )
+                self.load_ingredients(rows)
+
+    @staticmethod
+    def open_file(path):
+        if path == '-':
+            return open(sys.stdin.fileno(), encoding='utf-8', closefd=False)
+        try:
+            return open(path, encoding='utf-8-sig', newline='')
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+
+    @staticmethod
+    def json_rows(items):
+        for number, item in enumerate(items, 1):
+            if not isinstance(item, dict):
+                raise CommandError(f'Запись {number}: ожидается объект.')
+            yield item.get('name'), item.get('measurement_unit')
+
+    @staticmethod
+    def clean_ingredients(rows):
+        for number, row in enumerate(rows, 1):
+            if len(row) != 2:
+                raise CommandError(
+                    f'Запись {number}: нужны название и единица измерения.'
+                )
+            name, unit = row
+            yield (
+                clean_text(number, 'name', name),
+                clean_text(number, 'measurement_unit', unit),
+            )
+
+    def load_ingredients(self, rows):
+        started = time.monotonic()
+        before = Ingredient.objects.count()
+        rows = self.clean_ingredients(rows)
+        insert = (
+            self.copy_ingredients if connection.vendor == 'postgresql'
+            else self.create_ingredients
+        )
+        total = 0
+        try:
+            while True:
+                chunk = list(itertools.islice(rows, self.batch_size))
+                if not chunk:
+                    break
+                insert(chunk)
+                total += len(chunk)
+                self.stdout.write(f'Ингредиенты: обработано {total}')
+        except (csv.Error, json.JSONDecodeError, UnicodeDecodeError) as error:
+            raise CommandError(f'Некорректный файл ингредиентов: {error}')
+        added = Ingredient.objects.count() - before
+        if added:
+            transaction.on_commit(lambda: bump_version(INGREDIENTS))
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиенты: записей {total}, добавлено {added}, '
+            f'пропущено {total - added} '
+            f'({time.monotonic() - started:.1f} с)'
+        ))
+
+    def copy_ingredients(self, chunk):
+        """Загружает пакет через COPY во временную таблицу."""
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(chunk)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS catalog_ingredient '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY catalog_ingredient (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM catalog_ingredient '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            cursor.execute('TRUNCATE catalog_ingredient')
+
+    def create_ingredients(self, chunk):
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in chunk
+            ),
+            ignore_conflicts=True,
+        )
+
+    def load_tags(self, items):
+        existing = {tag.slug: tag for tag in Tag.objects.all()}
+        created = updated = 0
+        try:
+            for number, item in enumerate(items, 1):
+                if not isinstance(item, dict):
+                    raise CommandError(f'Тег {number}: ожидается объект.')
+                tag = existing.get(item.get('slug')) or Tag()
+                values = {
+                    'name': item.get('name'),
+                    'color': item.get('color'),
+                    'slug': item.get('slug'),
+                }
+                if all(
+                    getattr(tag, field) == value
+                    for field, value in values.items()
+                ):
+                    continue
+                for field, value in values.items():
+                    setattr(tag, field, value)
+                try:
+                    tag.full_clean()
+                except (ValidationError, APIValidationError) as error:
+                    # Валидаторы полей тега вызывают ошибку DRF.
+                    messages = getattr(error, 'messages', None) or error.detail
+                    raise CommandError(
+                        f'Тег {number}: ' + ' '.join(map(str, messages))
+                    )
+                if tag.pk is None:
+                    created += 1
+                else:
+                    updated += 1
+                tag.save()
+                existing[tag.slug] = tag
+        except json.JSONDecodeError as error:
+            raise CommandError(f'Некорректный файл тегов: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Теги: добавлено {created}, обновлено {updated}'
+        ))
@@ -0,0 +1,65 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+
+from core.cache import bump_recipes_version
+from core.storage import HASHED_NAME
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Переносит изображения рецептов в хранилище с именами по хэшу.
+
+    Изображение и его копии пересохраняются в каталог загрузки модели,
+    где получают имя по содержимому, а пути в рецепте обновляются.
+    Старые файлы остаются на месте до запуска collect_media_garbage.
+
+    Использование:
+    python manage.py migrate_media
+    """
+
+    help = 'Переносит изображения рецептов в новую структуру каталогов.'
+
+    def handle(self, *args, **options):
+        directory = Recipe._meta.get_field('image').upload_to
+        recipes = list(
+            Recipe.objects.exclude(image='')
+            .order_by('id').values_list('id', 'image', 'image_variants')
+        )
+        moved = failed = 0
+        for recipe_id, image, variants in recipes:
+            if HASHED_NAME.search(image):
+                continue
+            try:
+                paths = {
+                    path: self.move(path, directory)
+                    for path in {image, *variants.values()}
+                }
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                continue
+            Recipe.objects.filter(pk=recipe_id, image=image).update(
+                image=paths[image],
+                image_variants={
+                    variant: paths[path]
+                    for variant, path in variants.items()
+                },
+            )
+            moved += 1
+        if moved:
+            bump_recipes_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено рецептов: {moved}, ошибок: {failed}'
+        ))
+
+    @staticmethod
+    def move(path, directory):
+        if HASHED_NAME.search(path):
+            return path
+        with default_storage.open(path) as file:
+            return default_storage.save(
+                posixpath.join(directory, posixpath.basename(path)), file
+            )
@@ -0,0 +1,76 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from recipes.models import ShoppingListItem
+from recipes.totals import actual_totals
+from users.models import FoodUser
+
+
+class Command(BaseCommand):
+    """
+    Пересобирает итоги списков покупок и сообщает о расхождениях.
+
+    Итоги заново считаются по спискам покупок для диапазонов
+    пользователей и сравниваются с сохраненными. Строки пользователей
+    с расхождениями пересоздаются в одной транзакции на диапазон.
+    Итоги не обновляются при изменении ингредиентов рецепта в админке
+    и при массовой загрузке данных, после них команду нужно запустить.
+
+    Использование:
+    python manage.py rebuild_shopping_lists --dry-run
+    """
+
+    help = 'Пересобирает итоги списков покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать количество расхождений.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = FoodUser.objects.aggregate(last=Max('pk'))['last'] or 0
+        missing = extra = wrong = users = 0
+        for start in range(0, last_pk + 1, batch_size):
+            with transaction.atomic():
+                items = ShoppingListItem.objects.filter(
+                    user_id__gte=start, user_id__lt=start + batch_size
+                )
+                stored = {
+                    (user_id, ingredient_id): amount
+                    for user_id, ingredient_id, amount in items.values_list(
+                        'user_id', 'ingredient_id', 'amount'
+                    )
+                }
+                actual = actual_totals(start, start + batch_size)
+                stale = {
+                    user_id for user_id, _ in stored.keys() ^ actual.keys()
+                }
+                missing += len(actual.keys() - stored.keys())
+                extra += len(stored.keys() - actual.keys())
+                for key in stored.keys() & actual.keys():
+                    if stored[key] != actual[key]:
+                        wrong += 1
+                        stale.add(key[0])
+                users += len(stale)
+                if options['dry_run'] or not stale:
+                    continue
+                items.filter(user_id__in=stale).delete()
+                ShoppingListItem.objects.bulk_create(
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for (user_id, ingredient_id), amount in actual.items()
+                    if user_id in stale
+                )
+        self.stdout.write(
+            f'Пользователей с расхождениями: {users}, '
+            f'нет строк: {missing}, лишних строк: {extra}, '
+            f'неверных количеств: {wrong}'
+        )
+        self.stdout.write(self.style.SUCCESS('Списки покупок проверены!'))
@@ -0,0 +1,55 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max
+
+from recipes.counters import COUNTERS, actual_count
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает денормализованные счетчики рецептов и пользователей.
+
+    Счетчики сверяются с таблицами избранного, списков покупок,
+    рецептов и подписок по диапазонам первичных ключей, расхождения
+    исправляются одним UPDATE на диапазон.
+
+    Использование:
+    python manage.py recount_counters --dry-run
+    """
+
+    help = 'Пересчитывает счетчики избранного, покупок, рецептов и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать количество расхождений.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, field, related_model, related_field in COUNTERS:
+            last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+            drift = 0
+            for start in range(0, last_pk + 1, batch_size):
+                with transaction.atomic():
+                    stale = (
+                        model.objects
+                        .filter(pk__gte=start, pk__lt=start + batch_size)
+                        .annotate(actual=actual_count(
+                            related_model, related_field
+                        ))
+                        .exclude(**{field: F('actual')})
+                    )
+                    if options['dry_run']:
+                        drift += stale.count()
+                        continue
+                    drift += model.objects.filter(
+                        pk__in=stale.values('pk')
+                    ).update(**{field: actual_count(
+                        related_model, related_field
+                    )})
+            self.stdout.write(
+                f'{model._meta.label}.{field}: расхождений {drift}'
+            )
+        self.stdout.write(self.style.SUCCESS('Счетчики проверены!'))
@@ -0,0 +1,316 @@
+import io
+import itertools
+import os
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, call_command
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.cache import (
+    COVERAGE,
+    INGREDIENTS,
+    bump_recipes_version,
+    bump_version,
+)
+from recipes.management.commands.load_catalog import (
+    DATA_DIR,
+    Command as LoadCatalogCommand,
+    iter_json,
+)
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+)
+from users.models import Follow, FoodUser
+
+TAGS_FILE = os.path.join(DATA_DIR, 'tags.json')
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса распределения Ципфа для выбора по рангу."""
+    return list(itertools.accumulate(
+        1 / (rank ** exponent) for rank in range(1, size + 1)
+    ))
+
+
+def chunked(iterable, size):
+    """Разбивает поток на списки длиной size."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    """
+    Генерирует синтетические данные для нагрузочного тестирования.
+
+    Создает пользователей, рецепты с ингредиентами и тегами, избранное,
+    списки покупок и подписки. Популярность авторов и рецептов, а также
+    активность пользователей распределены по закону Ципфа. Одинаковый
+    --seed дает одинаковый набор данных.
+
+    Использование:
+    python manage.py seed_fake_data --users 10000 --recipes 100000
+    """
+
+    help = 'Генерирует синтетические данные для нагрузочного тестирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients', type=int, default=500,
+            help='Сколько ингредиентов создать, если справочник пуст.'
+        )
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=12)
+        parser.add_argument('--skew', type=float, default=1.1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загружать связи через COPY (только PostgreSQL).'
+        )
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.use_copy = (
+            options['copy'] and connection.vendor == 'postgresql'
+        )
+        self.skew = options['skew']
+        prefix = f'fake{options["seed"]}'
+
+        ingredient_ids = self.ensure_ingredients(options['ingredients'])
+        tag_ids = self.ensure_tags()
+        user_ids = self.create_users(prefix, options['users'])
+        recipe_ids = self.create_recipes(prefix, user_ids, options['recipes'])
+        if recipe_ids is None:
+            # Повторная генерация добавила бы к готовым рецептам новые
+            # случайные ингредиенты, теги и списки.
+            self.stdout.write(self.style.WARNING(
+                f'Данные с --seed {options["seed"]} уже созданы.'
+            ))
+            return
+
+        self.insert_links(
+            RecipeIngredient, ('recipe_id', 'ingredient_id', 'amount'),
+            (
+                (recipe_id, ingredient_id, self.rnd.randint(1, 500))
+                for recipe_id in recipe_ids
+                for ingredient_id in self.rnd.sample(
+                    ingredient_ids,
+                    min(len(ingredient_ids), self.rnd.randint(
+                        options['min_ingredients'],
+                        options['max_ingredients'],
+                    )),
+                )
+            ),
+        )
+        self.insert_links(
+            Recipe.tags.through, ('recipe_id', 'tag_id'),
+            (
+                (recipe_id, tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in self.rnd.sample(
+                    tag_ids, min(len(tag_ids), self.rnd.randint(1, 3))
+                )
+            ),
+        )
+        # Одни и те же пользователи активно добавляют в избранное и
+        # в покупки, а популярные рецепты встречаются чаще остальных.
+        self.insert_links(
+            Favorite, ('user_id', 'recipe_id'),
+            self.skewed_pairs(user_ids, recipe_ids, options['favorites']),
+        )
+        self.insert_links(
+            ShoppingCart, ('user_id', 'recipe_id'),
+            self.skewed_pairs(user_ids, recipe_ids, options['carts']),
+        )
+        self.insert_links(
+            Follow, ('user_id', 'following_id'),
+            (
+                (user_id, following_id)
+                for user_id, following_id in self.skewed_pairs(
+                    user_ids, user_ids, options['follows']
+                )
+                if user_id != following_id
+            ),
+        )
+        # bulk_create и COPY не отправляют сигналы, обновляющие счетчики,
+        # итоги списков покупок и поисковые векторы.
+        call_command('recount_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('update_search_vectors', stdout=self.stdout)
+        call_command('update_trending', '--rebuild', stdout=self.stdout)
+        # Работающие процессы перечитают рецепты и индекс покрытия.
+        bump_recipes_version()
+        bump_version(COVERAGE)
+        self.stdout.write(self.style.SUCCESS('Данные сгенерированы!'))
+
+    def ensure_ingredients(self, count):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=f'ингредиент {i}',
+                        measurement_unit=self.rnd.choice(('г', 'мл', 'шт')),
+                    )
+                    for i in range(count)
+                ),
+                batch_size=self.batch_size,
+            )
+            bump_version(INGREDIENTS)
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def ensure_tags(self):
+        """Загружает теги из справочника, как это делает load_catalog."""
+        with LoadCatalogCommand.open_file(TAGS_FILE) as file:
+            LoadCatalogCommand(stdout=self.stdout).load_tags(
+                iter_json(file)
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, prefix, count):
+        password = make_password(prefix)
+        FoodUser.objects.bulk_create(
+            (
+                FoodUser(
+                    email=f'{prefix}_{i}@example.com',
+                    username=f'{prefix}_{i}',
+                    first_name='Имя',
+                    last_name='Фамилия',
+                    password=password,
+                )
+                for i in range(count)
+            ),
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        user_ids = list(
+            FoodUser.objects.filter(username__startswith=f'{prefix}_')
+            .order_by('id').values_list('id', flat=True)
+        )
+        self.stdout.write(f'Пользователи: {len(user_ids)}')
+        return user_ids
+
+    def create_recipes(self, prefix, user_ids, count):
+        """Создает рецепты или возвращает None, если они уже есть."""
+        recipes = Recipe.objects.filter(name__startswith=f'{prefix} рецепт')
+        if recipes.exists():
+            return None
+        self.bulk_create_recipes(prefix, user_ids, count)
+        recipe_ids = list(
+            recipes.order_by('id').values_list('id', flat=True)
+        )
+        self.stdout.write(f'Рецепты: {len(recipe_ids)}')
+        return recipe_ids
+
+    def bulk_create_recipes(self, prefix, user_ids, count):
+        authors = self.rnd.choices(
+            user_ids,
+            cum_weights=zipf_weights(len(user_ids), self.skew),
+            k=count,
+        )
+        pub_dates = sorted(
+            self.rnd.randint(0, 3 * 365 * 24 * 3600) for _ in range(count)
+        )
+        started = timezone.now()
+        rows = enumerate(zip(authors, reversed(pub_dates)))
+        for chunk in chunked(rows, self.batch_size):
+            last_id = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+            with transaction.atomic():
+                Recipe.objects.bulk_create(
+                    Recipe(
+                        author_id=author_id,
+                        name=f'{prefix} рецепт {number}',
+                        text='Описание рецепта',
+                        cooking_time=self.rnd.randint(5, 180),
+                    )
+                    for number, (author_id, _) in chunk
+                )
+                # auto_now_add задает дату при вставке, поэтому даты
+                # публикации записываются отдельным UPDATE.
+                pub_dates = {
+                    f'{prefix} рецепт {number}':
+                        started - timedelta(seconds=age)
+                    for number, (_, age) in chunk
+                }
+                Recipe.objects.bulk_update(
+                    (
+                        Recipe(id=pk, pub_date=pub_dates[name])
+                        for pk, name in Recipe.objects.filter(
+                            id__gt=last_id
+                        ).values_list('id', 'name')
+                    ),
+                    ('pub_date',),
+                    batch_size=1000,
+                )
+
+    def skewed_pairs(self, left_ids, right_ids, count):
+        """Пары (left, right) с перекосом в сторону популярных объектов."""
+        left = left_ids[:]
+        right = right_ids[:]
+        self.rnd.shuffle(left)
+        self.rnd.shuffle(right)
+        left_weights = zipf_weights(len(left), self.skew)
+        right_weights = zipf_weights(len(right), self.skew)
+        for _ in range(0, count, self.batch_size):
+            size = min(self.batch_size, count)
+            yield from zip(
+                self.rnd.choices(left, cum_weights=left_weights, k=size),
+                self.rnd.choices(right, cum_weights=right_weights, k=size),
+            )
+            count -= size
+
+    def insert_links(self, model, fields, rows):
+        """Пакетно вставляет строки, пропуская дубликаты."""
+        total = 0
+        for chunk in chunked(rows, self.batch_size):
+            with transaction.atomic():
+                if self.use_copy:
+                    self.copy_chunk(model, fields, chunk)
+                else:
+                    model.objects.bulk_create(
+                        (model(**dict(zip(fields, row))) for row in chunk),
+                        ignore_conflicts=True,
+                    )
+            total += len(chunk)
+        self.stdout.write(f'{model._meta.db_table}: {total}')
+
+    @staticmethod
+    def copy_chunk(model, fields, chunk):
+        """Загружает пакет через COPY во временную таблицу."""
+        table = model._meta.db_table
+        columns = ', '.join(fields)
+        buffer = io.StringIO(
+            ''.join('\t'.join(map(str, row)) + '\n' for row in chunk)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS seed_{table} '
+                f'ON COMMIT DELETE ROWS AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.copy_expert(
+                f'COPY seed_{table} ({columns}) FROM STDIN', buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM seed_{table} '
+                f'ON CONFLICT DO NOTHING'
+            )
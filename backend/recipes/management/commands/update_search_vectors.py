@@ -0,0 +1,49 @@
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from recipes.models import Recipe
+from recipes.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает поисковые векторы рецептов.
+
+    Нужна после загрузок, которые пишут рецепты и ингредиенты в обход
+    сигналов, например seed_fake_data. Рецепты обновляются по
+    диапазонам первичных ключей, каждый диапазон в своей транзакции.
+
+    Использование:
+    python manage.py update_search_vectors
+    """
+
+    help = 'Пересчитывает поисковые векторы рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Только рецепты без поискового вектора.'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(
+                'Поисковые векторы хранятся только в PostgreSQL.'
+            )
+            return
+        batch_size = options['batch_size']
+        recipes = Recipe.objects.all()
+        if options['missing']:
+            recipes = recipes.filter(search_vector__isnull=True)
+        last_pk = recipes.aggregate(last=Max('pk'))['last'] or 0
+        updated = 0
+        for start in range(0, last_pk + 1, batch_size):
+            with transaction.atomic():
+                updated += update_search_vectors(
+                    recipes.filter(pk__gte=start, pk__lt=start + batch_size)
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые векторы обновлены: {updated}'
+        ))
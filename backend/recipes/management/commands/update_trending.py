@@ -0,0 +1,76 @@
+import math
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Max, Q, Value, When
+from django.db.models.functions import Ln
+
+from recipes.models import Recipe
+from recipes.trending import trending_time
+
+
+class Command(BaseCommand):
+    """
+    Обслуживает очки популярности рецептов.
+
+    Порядок рецептов по очкам не зависит от времени, поэтому для
+    сортировки команду запускать не нужно. Без параметров она обнуляет
+    очки, затухшие ниже --min-score добавлений: такие рецепты больше
+    не популярны, а индекс по очкам не засоряется старыми значениями.
+
+    С --rebuild очки заново задаются по текущим счетчикам, как если бы
+    все добавления были сделаны сейчас. Это нужно после загрузок в
+    обход сигналов и после изменения TRENDING_HALF_LIFE.
+
+    Использование:
+    python manage.py update_trending
+    python manage.py update_trending --rebuild
+    """
+
+    help = 'Обслуживает очки популярности рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--min-score', type=float, default=0.01,
+            help='Очки меньше этого числа добавлений обнуляются.'
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Задать очки по счетчикам избранного и списков покупок.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1 or options['min_score'] <= 0:
+            raise CommandError(
+                '--batch-size и --min-score должны быть больше нуля.'
+            )
+        now = trending_time()
+        if options['rebuild']:
+            recipes = Recipe.objects.all()
+            count = F('favorites_count') + F('in_carts_count')
+            values = {'trending_score': Case(
+                When(
+                    Q(favorites_count__gt=0) | Q(in_carts_count__gt=0),
+                    then=Ln(count) + Value(now),
+                ),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )}
+        else:
+            recipes = Recipe.objects.filter(
+                trending_score__gt=0,
+                trending_score__lt=now + math.log(options['min_score']),
+            )
+            values = {'trending_score': Value(0.0)}
+        last_pk = recipes.aggregate(last=Max('pk'))['last'] or 0
+        updated = 0
+        for start in range(0, last_pk + 1, batch_size):
+            with transaction.atomic():
+                updated += recipes.filter(
+                    pk__gte=start, pk__lt=start + batch_size
+                ).update(**values)
+        self.stdout.write(self.style.SUCCESS(
+            f'Очки популярности обновлены: {updated}'
+        ))
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+from core.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='ingredient',
+            index=models.Index(
+                Upper('name'), name='ingredient_name_upper_idx'
+            ),
+            postgres_sql=(
+                'CREATE INDEX CONCURRENTLY ingredient_name_upper_idx '
+                'ON recipes_ingredient (UPPER(name) text_pattern_ops)'
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_idx'
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx',
+            ),
+        ),
+    ]
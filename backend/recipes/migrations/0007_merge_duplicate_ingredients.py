@@ -0,0 +1,64 @@
+# Generated by Django 3.2.23 on 2026-10-18 20:04
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_rows(model, field, keeper_id, duplicate_ids):
+    """
+    Переносит строки model с дубликатов ингредиента на keeper_id.
+
+    Если у владельца строки (рецепта или пользователя) уже есть строка
+    с keeper_id, количества складываются, а лишняя строка удаляется.
+    """
+    rows = model.objects.filter(
+        ingredient_id__in=[keeper_id, *duplicate_ids]
+    ).order_by('ingredient_id', 'id')
+    kept = {}
+    for row in rows:
+        owner = getattr(row, field)
+        if owner not in kept:
+            kept[owner] = row
+            if row.ingredient_id != keeper_id:
+                row.ingredient_id = keeper_id
+                row.save(update_fields=('ingredient',))
+            continue
+        target = kept[owner]
+        target.amount += row.amount
+        target.save(update_fields=('amount',))
+        row.delete()
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(count=Count('id'), keeper_id=Min('id'))
+        .filter(count__gt=1)
+    )
+    for group in groups:
+        keeper_id = group['keeper_id']
+        duplicate_ids = list(
+            Ingredient.objects.filter(
+                name=group['name'],
+                measurement_unit=group['measurement_unit'],
+            ).exclude(id=keeper_id).values_list('id', flat=True)
+        )
+        merge_rows(RecipeIngredient, 'recipe_id', keeper_id, duplicate_ids)
+        merge_rows(ShoppingListItem, 'user_id', keeper_id, duplicate_ids)
+        Ingredient.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_image_upload_to'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+    ]
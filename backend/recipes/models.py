@@ -1,5 +1,8 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.functions import RowNumber, Upper
 
 from .validators import color_validator, slug_validator
 from core.consts import (
@@ -9,7 +12,7 @@ from core.consts import (
     CHAR_FIELD_LENGTH_MAX,
     MIN_VALUE_COOKING_TIME_AND_AMOUNT
 )
-from users.models import FoodUser
+from users.models import Follow, FoodUser
 
 
 class Ingredient(models.Model):
@@ -25,6 +28,15 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = (
+            models.Index(Upper('name'), name='ingredient_name_upper_idx'),
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_name_unit'
+            ),
+        )
 
     def __str__(self):
         return f'{self.name} - {self.measurement_unit}'
@@ -56,6 +68,88 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для рецептов."""
+
+    def with_related(self):
+        """
+        Подгружает автора, теги и ингредиенты рецептов.
+
+        Поисковый вектор нужен только в запросах СУБД и не загружается.
+        """
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+
+    def with_user_flags(self, user):
+        """Добавляет флаги избранного, списка покупок и подписки."""
+        if user.is_anonymous:
+            return self
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_author_subscribed=models.Exists(
+                Follow.objects.filter(
+                    user=user, following=models.OuterRef('author')
+                )
+            ),
+        )
+
+    def latest_by_authors(self, author_ids, limit):
+        """
+        Возвращает последние limit рецептов каждого автора одним запросом.
+
+        Результат — словарь {id автора: [рецепты]}.
+        """
+        recipes = {author_id: [] for author_id in author_ids}
+        if not author_ids or limit <= 0:
+            return recipes
+        ranked = (
+            self.filter(author_id__in=author_ids)
+            .annotate(row_number=models.Window(
+                RowNumber(),
+                partition_by=models.F('author_id'),
+                order_by=(models.F('pub_date').desc(), models.F('id').desc()),
+            ))
+            .values('id', 'author_id', 'name', 'image', 'cooking_time',
+                    'pub_date', 'row_number')
+        )
+        sql, params = ranked.query.sql_with_params()
+        for recipe in self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            f'ORDER BY author_id, row_number',
+            (*params, limit),
+        ):
+            recipes[recipe.author_id].append(recipe)
+        return recipes
+
+    def feed(self, user):
+        """
+        Рецепты авторов, на которых подписан user.
+
+        Подписки отбираются подзапросом author_id IN (SELECT ...), поэтому
+        запрос не зависит от числа подписок и использует индекс
+        (author, -pub_date).
+        """
+        return self.filter(author_id__in=Follow.objects.filter(
+            user=user
+        ).values('following_id'))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         FoodUser,
@@ -68,10 +162,16 @@ class Recipe(models.Model):
         max_length=CHAR_FIELD_LENGTH_MIDDLE)
     image = models.ImageField(
         'Изображение рецепта',
-        upload_to='static/recipes/',
+        upload_to='recipes/',
         blank=True,
         null=True
     )
+    image_variants = models.JSONField(
+        'Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         'Описание рецепта')
     ingredients = models.ManyToManyField(
@@ -93,12 +193,60 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         'Дата публикации',
         auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    interactions_changed = models.DateTimeField(
+        'Избранное или списки покупок изменены',
+        null=True,
+        editable=False,
+        help_text='Сбрасывается после пересчета похожих рецептов.',
+    )
+    trending_score = models.FloatField(
+        'Популярность',
+        default=0,
+        editable=False,
+        help_text='Логарифм суммы затухающих весов добавлений.',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
 
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx'
+            ),
+            GinIndex(fields=('search_vector',), name='recipe_search_idx'),
+            models.Index(
+                fields=('interactions_changed',),
+                name='recipe_interactions_idx',
+                condition=models.Q(interactions_changed__isnull=False),
+            ),
+            models.Index(
+                fields=('-trending_score', '-id'),
+                name='recipe_trending_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -187,3 +335,65 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        FoodUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.amount}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт по пользователям, добавившим оба рецепта."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField('Косинусное сходство')
+
+    class Meta:
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} - {self.similar}: {self.score:.3f}'
@@ -0,0 +1,106 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    TextField,
+    Value,
+    When,
+)
+
+from recipes.models import RecipeIngredient
+
+# Конфигурация полнотекстового поиска PostgreSQL.
+SEARCH_CONFIG = 'russian'
+
+
+def search_vector():
+    """
+    Поисковый вектор рецепта: название (вес A), названия ингредиентов
+    (вес B) и описание (вес C).
+    """
+    ingredient_names = (
+        RecipeIngredient.objects.filter(recipe=OuterRef('pk'))
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(ingredient_names, output_field=TextField()),
+            weight='B', config=SEARCH_CONFIG,
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """
+    Пересчитывает поисковые векторы рецептов queryset одним UPDATE.
+
+    На СУБД кроме PostgreSQL векторы не хранятся.
+    """
+    if connection.vendor != 'postgresql':
+        return 0
+    return queryset.update(search_vector=search_vector())
+
+
+def schedule_search_update(queryset):
+    """
+    Пересчитывает векторы рецептов queryset после фиксации транзакции.
+
+    К этому моменту ингредиенты рецепта уже сохранены, даже если они
+    записаны после самого рецепта.
+    """
+    if connection.vendor == 'postgresql':
+        transaction.on_commit(lambda: update_search_vectors(queryset))
+
+
+def search_recipes(queryset, text):
+    """
+    Отбирает рецепты по поисковому запросу и сортирует по релевантности.
+
+    В PostgreSQL запрос разбирается как websearch_to_tsquery и
+    ранжируется ts_rank по сохраненному вектору. На других СУБД каждое
+    слово ищется по подстроке в названии, описании и ингредиентах, а
+    рецепты с совпадением в названии идут первыми.
+    """
+    if not text.strip():
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-pub_date', '-id')
+        )
+    words = text.split()
+    for word in words:
+        queryset = queryset.filter(
+            Q(name__icontains=word)
+            | Q(text__icontains=word)
+            | Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=word
+            ))
+        )
+    return queryset.annotate(rank=Case(
+        When(
+            Q(*(Q(name__icontains=word) for word in words)),
+            then=Value(1.0),
+        ),
+        default=Value(0.5),
+        output_field=FloatField(),
+    )).order_by('-rank', '-pub_date', '-id')
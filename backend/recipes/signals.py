@@ -0,0 +1,128 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from recipes.bulk import LIST_CHANGE_VALUES, LIST_COUNTERS
+from recipes.counters import change_counter
+from recipes.images import schedule_variants
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from recipes.search import schedule_search_update
+from recipes.totals import (
+    change_recipe_totals,
+    change_totals,
+    recipe_amounts,
+)
+from users.models import Follow, FoodUser
+
+
+def update_counter(model, field, attname, values):
+    """
+    Создает обработчики, поддерживающие счетчик field у model.
+
+    values - другие поля, которые записываются вместе со счетчиком.
+    """
+
+    def on_save(sender, instance, created, raw=False, **kwargs):
+        if created and not raw:
+            change_counter(
+                model, field, (getattr(instance, attname),), **values
+            )
+
+    def on_delete(sender, instance, **kwargs):
+        change_counter(
+            model, field, (getattr(instance, attname),), -1, **values
+        )
+
+    return on_save, on_delete
+
+
+for sender, model, field, attname, values in (
+    (Favorite, Recipe, 'favorites_count', 'recipe_id',
+     LIST_CHANGE_VALUES),
+    (ShoppingCart, Recipe, 'in_carts_count', 'recipe_id',
+     LIST_CHANGE_VALUES),
+    (Recipe, FoodUser, 'recipes_count', 'author_id', {}),
+    (Follow, FoodUser, 'followers_count', 'following_id', {}),
+):
+    on_save, on_delete = update_counter(model, field, attname, values)
+    post_save.connect(on_save, sender=sender, weak=False)
+    # Обработчик удаления отключил бы быстрое каскадное удаление
+    # избранного, списков покупок и подписок: Django загружал бы каждую
+    # строку. Их счетчики и итоги покупок меняют remove_user_relations,
+    # remove_from_shopping_lists и код, который удаляет строки напрямую.
+    if sender is Recipe:
+        post_delete.connect(on_delete, sender=sender, weak=False)
+
+
+def remove_user_relations(sender, instance, **kwargs):
+    """
+    Уменьшает счетчики рецептов и авторов перед удалением пользователя.
+
+    Избранное, списки покупок и подписки пользователя удаляются
+    каскадом одним DELETE на таблицу, а счетчики меняются одним UPDATE
+    на счетчик.
+    """
+    for model, field in LIST_COUNTERS.items():
+        change_counter(
+            Recipe, field,
+            model.objects.filter(user=instance)
+            .values_list('recipe_id', flat=True),
+            -1, **LIST_CHANGE_VALUES
+        )
+    change_counter(
+        FoodUser, 'followers_count',
+        Follow.objects.filter(user=instance)
+        .values_list('following_id', flat=True),
+        -1,
+    )
+
+
+pre_delete.connect(remove_user_relations, sender=FoodUser)
+
+
+def add_to_shopping_list(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_totals(
+            (instance.user_id,), recipe_amounts(instance.recipe_id)
+        )
+
+
+def remove_from_shopping_lists(sender, instance, **kwargs):
+    """
+    Вычитает ингредиенты удаляемого рецепта из всех списков покупок.
+
+    pre_delete: ингредиенты рецепта еще не удалены каскадом. Строки
+    списков покупок удаляются одним DELETE, а итоги всех пользователей
+    меняются одним вызовом change_recipe_totals.
+    """
+    change_recipe_totals(instance.pk, {
+        pk: -amount for pk, amount in recipe_amounts(instance.pk).items()
+    })
+
+
+post_save.connect(add_to_shopping_list, sender=ShoppingCart)
+pre_delete.connect(remove_from_shopping_lists, sender=Recipe)
+
+
+def build_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(instance)
+
+
+post_save.connect(build_image_variants, sender=Recipe)
+
+
+def update_recipe_search(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_search_update(Recipe.objects.filter(pk=instance.pk))
+
+
+def update_ingredient_search(sender, instance, created, raw=False,
+                             **kwargs):
+    # У нового ингредиента еще нет рецептов.
+    if not created and not raw:
+        schedule_search_update(
+            Recipe.objects.filter(recipeingredient__ingredient=instance)
+        )
+
+
+post_save.connect(update_recipe_search, sender=Recipe)
+post_save.connect(update_ingredient_search, sender=Ingredient)
@@ -0,0 +1,143 @@
+import numpy as np
+
+from recipes.models import Favorite, ShoppingCart
+
+# Сдвиг id пользователя в 64-битном ключе (пользователь, рецепт).
+KEY_SHIFT = 32
+
+
+def load_interactions(max_user_recipes=None):
+    """
+    Загружает пары (пользователь, рецепт) из избранного и списков покупок.
+
+    Пара учитывается один раз, даже если рецепт есть и в избранном, и в
+    списке покупок. Пользователи, у которых больше max_user_recipes
+    рецептов, пропускаются: они почти ничего не говорят о сходстве, а
+    число пар рецептов растет как квадрат их списка.
+    """
+    keys = np.unique(np.concatenate([
+        np.fromiter(
+            (
+                (user_id << KEY_SHIFT) | recipe_id
+                for user_id, recipe_id in model.objects.order_by()
+                .values_list('user_id', 'recipe_id')
+                .iterator(chunk_size=10000)
+            ),
+            dtype=np.int64,
+        )
+        for model in (Favorite, ShoppingCart)
+    ]))
+    users = keys >> KEY_SHIFT
+    recipes = keys & ((1 << KEY_SHIFT) - 1)
+    if max_user_recipes:
+        _, user_index, user_counts = np.unique(
+            users, return_inverse=True, return_counts=True
+        )
+        keep = user_counts[user_index] <= max_user_recipes
+        users, recipes = users[keep], recipes[keep]
+    return InteractionMatrix(users, recipes)
+
+
+def ranges(starts, lengths):
+    """Индексы, составленные из отрезков [start, start + length)."""
+    offsets = np.cumsum(lengths) - lengths
+    return (
+        np.repeat(starts - offsets, lengths)
+        + np.arange(lengths.sum(), dtype=np.int64)
+    )
+
+
+class InteractionMatrix:
+    """
+    Разреженная бинарная матрица пользователь x рецепт.
+
+    Хранится в двух сжатых видах: по строкам (рецепты пользователя) и
+    по столбцам (пользователи рецепта), как пары indptr и indices.
+    Пары (пользователь, рецепт) должны быть отсортированы по
+    пользователю.
+    """
+
+    def __init__(self, users, recipes):
+        self.user_ids, user_index = np.unique(users, return_inverse=True)
+        self.recipe_ids, recipe_index = np.unique(
+            recipes, return_inverse=True
+        )
+        self.user_degree = np.bincount(
+            user_index, minlength=len(self.user_ids)
+        )
+        self.recipe_degree = np.bincount(
+            recipe_index, minlength=len(self.recipe_ids)
+        )
+        self.user_indptr = np.concatenate(([0], np.cumsum(self.user_degree)))
+        self.user_recipes = recipe_index
+        by_recipe = np.argsort(recipe_index, kind='stable')
+        self.recipe_indptr = np.concatenate(
+            ([0], np.cumsum(self.recipe_degree))
+        )
+        self.recipe_users = user_index[by_recipe]
+
+    def positions(self, recipe_ids):
+        """Позиции рецептов recipe_ids, у которых есть пользователи."""
+        recipe_ids = np.asarray(sorted(recipe_ids), dtype=np.int64)
+        found = np.searchsorted(self.recipe_ids, recipe_ids)
+        found = found[found < len(self.recipe_ids)]
+        return found[np.isin(self.recipe_ids[found], recipe_ids)]
+
+    def related(self, positions):
+        """Позиции рецептов, у которых есть общие пользователи с positions."""
+        users = np.unique(self.recipe_users[ranges(
+            self.recipe_indptr[positions], self.recipe_degree[positions]
+        )])
+        return np.unique(self.user_recipes[ranges(
+            self.user_indptr[users], self.user_degree[users]
+        )])
+
+    def chunks(self, positions, max_pairs):
+        """
+        Делит рецепты positions на части, в каждой из которых не больше
+        max_pairs пар (рецепт, рецепт общего пользователя).
+        """
+        work = np.add.reduceat(
+            self.user_degree[self.recipe_users], self.recipe_indptr[:-1]
+        )[positions]
+        bounds = np.cumsum(work) // max_pairs
+        for bound in np.unique(bounds):
+            yield positions[bounds == bound]
+
+    def neighbors(self, positions, top_k, min_common=1):
+        """
+        Top-K рецептов по косинусному сходству для рецептов positions.
+
+        Сходство рецептов i и j - число общих пользователей, деленное
+        на sqrt(пользователей i * пользователей j). Возвращает массивы
+        (id рецепта, id похожего рецепта, сходство).
+        """
+        count = len(self.recipe_ids)
+        starts = self.recipe_indptr[positions]
+        lengths = self.recipe_degree[positions]
+        rows = np.repeat(np.arange(len(positions)), lengths)
+        users = self.recipe_users[ranges(starts, lengths)]
+        user_lengths = self.user_degree[users]
+        rows = np.repeat(rows, user_lengths)
+        columns = self.user_recipes[
+            ranges(self.user_indptr[users], user_lengths)
+        ]
+        keys, common = np.unique(
+            rows.astype(np.int64) * count + columns, return_counts=True
+        )
+        rows, columns = keys // count, keys % count
+        keep = (columns != positions[rows]) & (common >= min_common)
+        rows, columns, common = rows[keep], columns[keep], common[keep]
+        scores = common / np.sqrt(
+            self.recipe_degree[positions[rows]].astype(np.float64)
+            * self.recipe_degree[columns]
+        )
+        order = np.lexsort((-scores, rows))
+        rows, columns, scores = rows[order], columns[order], scores[order]
+        first = np.searchsorted(rows, rows)
+        keep = np.arange(len(rows)) - first < top_k
+        return (
+            self.recipe_ids[positions[rows[keep]]],
+            self.recipe_ids[columns[keep]],
+            scores[keep],
+        )
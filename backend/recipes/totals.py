@@ -0,0 +1,101 @@
+from collections import Counter
+
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+def recipe_amounts(recipe_id):
+    """Количества ингредиентов рецепта: {ingredient_id: amount}."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id)
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def amounts_diff(old, new):
+    """Изменения количеств между двумя наборами ингредиентов."""
+    delta = Counter(new)
+    delta.subtract(old)
+    return {pk: amount for pk, amount in delta.items() if amount}
+
+
+def change_totals(user_ids, amounts, sign=1):
+    """
+    Прибавляет amounts к спискам покупок пользователей user_ids.
+
+    Недостающие строки создаются с нулевым количеством, изменение
+    применяется одним UPDATE, а обнулившиеся строки удаляются.
+    """
+    amounts = {pk: amount * sign for pk, amount in amounts.items() if amount}
+    if not user_ids or not amounts:
+        return
+    added = [pk for pk, amount in amounts.items() if amount > 0]
+    if added:
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(user_id=user_id, ingredient_id=pk, amount=0)
+                for user_id in user_ids
+                for pk in added
+            ),
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=amounts
+    )
+    items.update(amount=Greatest(
+        F('amount') + Case(
+            *(
+                When(ingredient_id=pk, then=Value(amount))
+                for pk, amount in amounts.items()
+            ),
+            default=Value(0),
+        ),
+        Value(0),
+    ))
+    if any(amount < 0 for amount in amounts.values()):
+        items.filter(amount=0).delete()
+
+
+def change_recipe_totals(recipe_id, amounts):
+    """Применяет изменения ингредиентов рецепта ко всем его корзинам."""
+    if not amounts:
+        return
+    change_totals(
+        list(
+            ShoppingCart.objects.filter(recipe_id=recipe_id)
+            .values_list('user_id', flat=True)
+        ),
+        amounts,
+    )
+
+
+def actual_totals(start, stop):
+    """Итоги, посчитанные заново для пользователей с id из [start, stop)."""
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in (
+            RecipeIngredient.objects
+            .filter(
+                recipe__shoppingcart__user_id__gte=start,
+                recipe__shoppingcart__user_id__lt=stop,
+            )
+            .values('recipe__shoppingcart__user_id', 'ingredient_id')
+            .annotate(total=Sum('amount'))
+            .values_list(
+                'recipe__shoppingcart__user_id', 'ingredient_id', 'total'
+            )
+        )
+    }
+
+
+def recipes_amounts(recipe_ids):
+    """Суммарные количества ингредиентов нескольких рецептов."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .values('ingredient_id')
+        .annotate(total=Sum('amount'))
+        .values_list('ingredient_id', 'total')
+    )
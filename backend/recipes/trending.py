@@ -0,0 +1,63 @@
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone as django_timezone
+
+# Точка отсчета очков популярности. Ее нельзя менять без --rebuild.
+TRENDING_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def decay_rate():
+    """Скорость затухания в секунду: вдвое за TRENDING_HALF_LIFE часов."""
+    return math.log(2) / (settings.TRENDING_HALF_LIFE * 3600)
+
+
+def trending_time(moment=None):
+    """
+    Логарифм веса добавления, сделанного в момент moment.
+
+    Очки рецепта - ln(sum(exp(rate * (t - TRENDING_EPOCH)))) по всем
+    добавлениям в избранное и списки покупок. Каждое добавление
+    затухает с одной скоростью, поэтому порядок рецептов по очкам не
+    зависит от текущего времени и индекс по ним всегда точный, а
+    пересчитывать очки по расписанию не нужно. Логарифм не дает
+    весам переполниться. Ноль означает отсутствие добавлений: любое
+    добавление после эпохи весит больше.
+    """
+    moment = moment or django_timezone.now()
+    return decay_rate() * (moment - TRENDING_EPOCH).total_seconds()
+
+
+def trending_change(delta):
+    """
+    Очки рецепта после delta добавлений (или удалений) в текущий момент.
+
+    Сложение весов в логарифмах считается как
+    max(a, b) + ln(1 + exp(-|a - b|)), без переполнения exp. Момент
+    удаленного добавления неизвестен, поэтому удаление вычитает вес
+    добавления, сделанного сейчас, но очки не становятся меньше нуля.
+    """
+    score = F('trending_score')
+    weight = Value(trending_time() + math.log(abs(delta)))
+    if delta > 0:
+        return Greatest(score, weight) + Ln(
+            Value(1.0) + Exp(-Abs(score - weight))
+        )
+    return Case(
+        When(
+            trending_score__gt=weight,
+            then=Greatest(
+                score + Ln(Value(1.0) - Exp(weight - score)), Value(0.0)
+            ),
+        ),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+# Поля, которые обновляются вместе со счетчиками избранного и списков
+# покупок: очки популярности зависят от изменения счетчика.
+TRENDING_CHANGE = {'trending_score': trending_change}
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db import transaction
 
 from .models import Follow, FoodUser
+from recipes.counters import change_counter
 
 
 @admin.register(FoodUser)
@@ -9,7 +11,8 @@ class FoodUserAdmin(BaseUserAdmin):
     """Админка пользователей."""
 
     list_display = (
-        'id', 'username', 'email', 'first_name', 'last_name'
+        'id', 'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'followers_count',
     )
     search_fields = ('username', 'first_name')
     ordering = ('username',)
@@ -21,3 +24,20 @@ class FollowAdmin(admin.ModelAdmin):
 
     list_display = ('following', 'user')
     search_fields = ('following',)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Follow.objects.filter(pk=obj.pk))
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        """
+        Удаляет подписки и уменьшает счетчики подписчиков авторов.
+
+        У подписок нет обработчиков удаления, чтобы каскадное удаление
+        пользователя не загружало каждую строку.
+        """
+        following_ids = list(
+            queryset.values_list('following_id', flat=True)
+        )
+        queryset.delete()
+        change_counter(FoodUser, 'followers_count', following_ids, -1)
@@ -28,6 +28,16 @@ class FoodUser(AbstractUser):
         'Пароль',
         max_length=CHAR_FIELD_LENGTH
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'пользователь'